@@ -0,0 +1,347 @@
+#! /usr/bin/env python
+
+import argparse
+import ast
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from builder import BuildError, time_command
+from compiler import LAYOUTS
+from compiler.parser import translate_file
+from compiler.passes import PASSES
+
+
+def synthetic_function(index):
+    return (
+        f"def function_{index}(x: int, y: int) -> int:\n"
+        f"    total = x + y * {index}\n"
+        f"    while total > {index}:\n"
+        f"        total -= 1\n"
+        f"    return total\n"
+        f"\n\n"
+    )
+
+
+def synthetic_class(index):
+    return (
+        f"class Class_{index}:\n"
+        f"    name: str\n"
+        f"    value: int\n"
+        f"\n"
+        f"    def hello(self) -> None:\n"
+        f"        print(self.name)\n"
+        f"\n"
+        f"    def add(self, num: int) -> int:\n"
+        f"        self.value += num * {index}\n"
+        f"        return self.value\n"
+        f"\n\n"
+    )
+
+
+def synthetic_loops(index, depth=4):
+    lines = [f"def loops_{index}(n: int) -> int:", "    total = 0"]
+
+    indent = "    "
+    for level in range(depth):
+        lines.append(f"{indent}i_{level} = 0")
+        lines.append(f"{indent}while i_{level} < n:")
+        indent += "    "
+        lines.append(f"{indent}i_{level} += 1")
+
+    lines.append(f"{indent}if total % {index + 2} == 0:")
+    lines.append(f"{indent}    total += i_0 * i_{depth - 1}")
+    lines.append("    return total")
+
+    return "\n".join(lines) + "\n\n\n"
+
+
+def synthetic_expression(index, terms=64):
+    operators = ("+", "-", "*", "<<", "^", "&", "|")
+    expression = " ".join(
+        f"{operators[term % len(operators)]} (x + {term})" for term in range(terms)
+    )
+
+    return (
+        f"def expression_{index}(x: int) -> int:\n"
+        f"    return {index} {expression}\n"
+        f"\n\n"
+    )
+
+
+GENERATORS = {
+    "functions": synthetic_function,
+    "classes": synthetic_class,
+    "loops": synthetic_loops,
+    "expressions": synthetic_expression,
+}
+
+
+def synthetic_module(count, kind="functions"):
+    """ Generate python source containing count definitions of a kind. """
+
+    generator = GENERATORS[kind]
+    return "".join(generator(index) for index in range(count))
+
+
+def sieve_module(size, layout):
+    """ Generate a sieve of eratosthenes storing its flags in a list layout. """
+
+    return (
+        "from typing import Annotated\n"
+        "\n\n"
+        "def count_primes(n: int) -> int:\n"
+        f'    flags: Annotated[list[bool], "{layout}"] = [True] * (n + 1)\n'
+        "    count = 0\n"
+        "    for i in range(2, n + 1):\n"
+        "        if flags[i]:\n"
+        "            count += 1\n"
+        "            if i <= n // i:\n"
+        "                for j in range(i * i, n + 1, i):\n"
+        "                    flags[j] = False\n"
+        "    return count\n"
+        "\n\n"
+        "def main() -> int:\n"
+        f"    print(count_primes({size}))\n"
+        "    return 0\n"
+    )
+
+
+def run_layouts(size, repeat, flags=("-O2",)):
+    """Time the sieve of size compiled with each list layout.
+
+    Returns the best runtime of each, in seconds, by layout.
+    """
+
+    runtimes = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for layout in LAYOUTS:
+            path = os.path.join(directory, f"sieve_{layout}.py")
+            with open(path, "w") as py_file:
+                py_file.write(sieve_module(size, layout))
+
+            cpp_path = os.path.join(directory, f"sieve_{layout}.cpp")
+            with open(cpp_path, "w") as cpp_file:
+                cpp_file.write(translate_file(path))
+
+            binary = os.path.join(directory, f"sieve_{layout}")
+            subprocess.run(["g++", *flags, "-o", binary, cpp_path], check=True)
+            runtimes[layout] = time_command(binary, repeat)
+
+    baseline = runtimes["packed"]
+    print(f"{'layout':<8}  {'runtime (s)':>11}  {'speedup':>8}")
+    for layout, runtime in runtimes.items():
+        print(f"{layout:<8}  {runtime:>11.3f}  {baseline / runtime:>7.2f}x")
+
+    return runtimes
+
+
+def count_nodes(source):
+    return sum(1 for _ in ast.walk(ast.parse(source)))
+
+
+def measure(path, repeat, passes=tuple(PASSES), stream=False):
+    """Translate path repeat times, returning the best wall time.
+
+    Peak memory is measured in a separate run, as tracemalloc slows
+    translation down considerably. The size of the generated code is
+    returned too.
+    """
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = translate_file(path, passes=passes, stream=stream)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        translate_file(path, passes=passes, stream=stream)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak, len(output.encode())
+
+
+def run_suite(kinds, sizes, repeat, passes=tuple(PASSES), stream=False):
+    results = []
+
+    print(
+        f"{'kind':<12}  {'size':>7}  {'nodes':>9}  {'time (s)':>9}  "
+        f"{'nodes/s':>10}  {'peak (MB)':>9}  {'output (KB)':>11}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in kinds:
+            for size in sizes:
+                source = synthetic_module(size, kind)
+
+                path = os.path.join(directory, f"{kind}_{size}.py")
+                with open(path, "w") as py_file:
+                    py_file.write(source)
+
+                nodes = count_nodes(source)
+                elapsed, peak, output_size = measure(path, repeat, passes, stream)
+
+                result = {
+                    "kind": kind,
+                    "size": size,
+                    "nodes": nodes,
+                    "time": elapsed,
+                    "nodes_per_second": nodes / elapsed,
+                    "peak_memory": peak,
+                    "output_size": output_size,
+                }
+                results.append(result)
+
+                print(
+                    f"{kind:<12}  {size:>7}  {nodes:>9}  {elapsed:>9.3f}  "
+                    f"{result['nodes_per_second']:>10.0f}  {peak / 2**20:>9.1f}  "
+                    f"{output_size / 2**10:>11.1f}"
+                )
+
+    return results
+
+
+def current_commit():
+    try:
+        process = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return process.stdout.strip()
+
+
+def compare(results, baseline_path):
+    """ Print the change of each case against a previously saved run. """
+
+    with open(baseline_path, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+
+    previous = {
+        (result["kind"], result["size"]): result for result in baseline["results"]
+    }
+
+    print(f"\nCompared to {baseline.get('commit') or baseline_path}:")
+    print(f"{'kind':<12}  {'size':>7}  {'time':>8}  {'peak memory':>11}")
+    for result in results:
+        old = previous.get((result["kind"], result["size"]))
+        if old is None:
+            continue
+
+        time_ratio = result["time"] / old["time"]
+        memory_ratio = result["peak_memory"] / old["peak_memory"]
+        print(
+            f"{result['kind']:<12}  {result['size']:>7}  "
+            f"{time_ratio:>7.2f}x  {memory_ratio:>10.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the translator")
+    parser.add_argument(
+        "sizes",
+        nargs="*",
+        type=int,
+        default=[100, 1000, 10000],
+        help="Number of definitions in each synthetic module",
+    )
+    parser.add_argument(
+        "--kinds",
+        nargs="+",
+        choices=sorted(GENERATORS),
+        default=list(GENERATORS),
+        help="Kinds of synthetic modules to translate",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Translate each module this many times and keep the best time",
+    )
+    parser.add_argument(
+        "--disable-pass",
+        action="append",
+        default=[],
+        choices=PASSES,
+        metavar="PASS",
+        help=f"Skip an optimisation pass, one of {', '.join(PASSES)} (repeatable)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Translate a top level statement at a time",
+    )
+    parser.add_argument(
+        "--layouts",
+        type=int,
+        metavar="N",
+        nargs="?",
+        const=1_000_000,
+        help="Instead, time a sieve of N (default 1000000) compiled with each "
+        "layout of list[bool]",
+    )
+    parser.add_argument(
+        "--json",
+        metavar="PATH",
+        help="Save the results to PATH",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="PATH",
+        help="Compare the results against those saved at PATH",
+    )
+    args = parser.parse_args()
+
+    if args.layouts is not None:
+        try:
+            runtimes = run_layouts(args.layouts, args.repeat)
+        except (BuildError, subprocess.CalledProcessError) as error:
+            parser.exit(1, f"Sieve benchmark failed: {error}\n")
+
+        if args.json is not None:
+            with open(args.json, "w") as json_file:
+                json.dump(
+                    {
+                        "commit": current_commit(),
+                        "size": args.layouts,
+                        "layouts": runtimes,
+                    },
+                    json_file,
+                    indent=2,
+                )
+        return
+
+    passes = [name for name in PASSES if name not in args.disable_pass]
+    results = run_suite(args.kinds, args.sizes, args.repeat, passes, args.stream)
+
+    if args.json is not None:
+        with open(args.json, "w") as json_file:
+            json.dump(
+                {
+                    "commit": current_commit(),
+                    "python": platform.python_version(),
+                    "passes": passes,
+                    "stream": args.stream,
+                    "results": results,
+                },
+                json_file,
+                indent=2,
+            )
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
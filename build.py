@@ -1,18 +1,65 @@
 #! /usr/bin/env python
 
+import argparse
+import contextlib
+import functools
+import logging
 import os
+import re
 import sys
+import time
 
-from compiler.parser import translate_file
+from builder import (
+    BUILD_PROFILES,
+    CHECKED_PROFILES,
+    PGO_GENERATE,
+    PGO_USE,
+    BuildCache,
+    BuildError,
+    ObjectCache,
+    clear_profile_data,
+    collect_includes,
+    compile_all,
+    compile_job,
+    format_runtimes,
+    format_timings,
+    header_path,
+    precompiled_header,
+    read_dependencies,
+    run_pipeline,
+    shard_paths,
+    time_command,
+    unity_groups,
+    write_dependencies,
+    write_unity_source,
+)
+from compiler import TranslationProfile
+from compiler.parser import translate_to_shards
+from compiler.passes import PASSES
 
 py_dir = "py"
 cpp_dir = "cpp"
 obj_dir = "obj"
+cache_dir = ".build_cache"
+object_cache_dir = os.path.join(cache_dir, "objects")
+
+CXXFLAGS = ()
+
+# The bases listed by a class statement
+CLASS_BASES = re.compile(r"^[ \t]*class\s+\w+\s*\(([^)]*)\)", re.MULTILINE)
+
+DEFAULT_PROFILE = "release"
+DEFAULT_FLAGS = (*CXXFLAGS, *BUILD_PROFILES[DEFAULT_PROFILE])
+
+logger = logging.getLogger(__name__)
 
 
 def execute(system_call):
     print(system_call)
-    os.system(system_call)
+    status = os.system(system_call)
+
+    if status != 0:
+        raise BuildError(f"{system_call!r} exited with status {status}")
 
 
 def find_files(root_dir, extension):
@@ -37,36 +84,654 @@ def replace_top_dir(path, target, new_ext=None):
     return f"{os.path.join(*dirs)}{ext}"
 
 
-def generate_cpp(path, output_path=None):
+def profile_path(path):
+    return replace_top_dir(path, cpp_dir, ".profile.json")
+
+
+def dependency_path(path):
+    return replace_top_dir(path, cpp_dir, ".d")
+
+
+def generated_paths(path):
+    """ Get the paths of the header and .d file that translating path writes. """
+
+    return [header_path(replace_top_dir(path, cpp_dir, ".cpp")), dependency_path(path)]
+
+
+def module_imports(path):
+    """ Get the project modules that path imported when last translated. """
+
+    return read_dependencies(dependency_path(path))
+
+
+def subclassed_names(py_files):
+    """Get the names of the classes that any of py_files derives from.
+
+    The sources are scanned rather than parsed, which keeps this cheap when
+    every module is cached. Whatever merely looks like a class statement only
+    leaves more classes without final.
+    """
+
+    names = set()
+    for py_file in py_files:
+        with open(py_file, "r") as source:
+            text = source.read()
+
+        for bases in CLASS_BASES.findall(text):
+            for base in bases.split(","):
+                match = re.match(r"\s*([\w.]+)\s*$", base.split("[")[0])
+                if match is not None:
+                    names.add(match.group(1).rsplit(".", 1)[-1])
+
+    return names
+
+
+def generate_cpp(
+    path,
+    output_path=None,
+    profile=False,
+    fast_io=False,
+    passes=tuple(PASSES),
+    stream=False,
+    shards=0,
+    import_root=None,
+    checked=False,
+    subclassed=None,
+):
+    """Translate path into c++, returning the path of the source written.
+
+    The module's includes, declarations and classes go in a header next to
+    output_path, for the modules importing it, and the project modules it
+    imports are listed in a .d file there. With shards, the module's
+    functions are split between that many sources instead, and the list of
+    their paths is returned.
+    """
+
     if output_path is None:
         output_path = replace_top_dir(path, cpp_dir, ".cpp")
 
-    with open(output_path, "w") as cpp_file:
-        print(translate_file(path), file=cpp_file, end="")
+    translation_profile = TranslationProfile() if profile else None
 
-    return output_path
+    cpp_paths = shard_paths(output_path, shards) if shards else [output_path]
+    header = header_path(output_path)
+
+    with contextlib.ExitStack() as files:
+        cpp_files = [files.enter_context(open(cpp, "w")) for cpp in cpp_paths]
+        header_file = files.enter_context(open(header, "w"))
+
+        converter = translate_to_shards(
+            path,
+            cpp_files,
+            header_file,
+            os.path.basename(header),
+            translation_profile,
+            fast_io,
+            passes,
+            stream,
+            import_root,
+            checked,
+            subclassed,
+        )
+
+    write_dependencies(
+        f"{os.path.splitext(output_path)[0]}.d",
+        [os.path.relpath(module) for module in converter.imports],
+    )
+
+    emitters = converter.shard_emitters
+    logger.info(
+        "Wrote %d bytes to %s (peak buffer %d bytes)",
+        sum(emitter.bytes_written for emitter in emitters),
+        ", ".join(cpp_paths),
+        max(emitter.peak_memory for emitter in emitters),
+    )
+
+    if profile:
+        translation_profile.dump_json(profile_path(path))
+
+    return cpp_paths if shards else output_path
 
 
-def compile_cpp(path):
+def compile_command(path, pch=None, flags=DEFAULT_FLAGS):
     output_path = replace_top_dir(path, obj_dir, ".o")
-    execute(f"g++ -c -o {output_path} {path}")
+
+    command = ["g++", *flags]
+    if pch is not None:
+        command.extend(("-Winvalid-pch", "-include", pch))
+
+    return [*command, "-c", "-o", output_path, path], output_path
+
+
+def compile_cpp(path, flags=DEFAULT_FLAGS):
+    command, output_path = compile_command(path, flags=flags)
+    execute(" ".join(command))
 
     return output_path
 
 
-def build(objects):
-    execute(f"g++ -o main {' '.join(objects)}")
+def build(objects, flags=DEFAULT_FLAGS, target="main"):
+    execute(" ".join(["g++", *flags, "-o", target, *objects]))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Translate and build a project")
+    parser.add_argument("project", help=f"Name of a project under {py_dir}/")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Translate and compile every module, ignoring the build cache",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of modules to translate and compile in parallel",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="Log translator progress (-v for info, -vv to trace every node)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the translator and print the slowest visitors and lines",
+    )
+    parser.add_argument(
+        "--profile-json",
+        metavar="PATH",
+        help="Profile the translator and write the results to PATH as JSON",
+    )
+    parser.add_argument(
+        "--no-object-cache",
+        action="store_true",
+        help=f"Always run g++ rather than reuse objects from {object_cache_dir}",
+    )
+    parser.add_argument(
+        "--object-cache-size",
+        type=int,
+        default=512,
+        metavar="MB",
+        help="Evict the least recently used objects beyond this size",
+    )
+    parser.add_argument(
+        "--pch",
+        action="store_true",
+        help="Precompile the headers included by the project's modules",
+    )
+    parser.add_argument(
+        "--unity",
+        type=int,
+        metavar="N",
+        nargs="?",
+        const=1,
+        help="Merge the modules into N translation units (default 1)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Split the functions of each module between N translation units, "
+        "compiled in parallel",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="With --unity, also time a per-file build and report the difference",
+    )
+    parser.add_argument(
+        "--build-profile",
+        choices=BUILD_PROFILES,
+        default=DEFAULT_PROFILE,
+        help=f"Optimisation flags to compile and link with (default {DEFAULT_PROFILE})",
+    )
+    parser.add_argument(
+        "--pgo",
+        metavar="COMMAND",
+        nargs="?",
+        const="./main",
+        help="Optimise using a profile of COMMAND (default ./main) run on an "
+        "instrumented build",
+    )
+    parser.add_argument(
+        "--compare-profiles",
+        action="store_true",
+        help="Build with every profile and report how fast ./main runs with each",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=3,
+        help="With --compare-profiles, time this many runs of each build",
+    )
+    parser.add_argument(
+        "--fast-io",
+        action="store_true",
+        help="Buffer the output of main rather than keep it in sync with stdio",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Translate each module a top level statement at a time, bounding "
+        "memory use for very large modules",
+    )
+    parser.add_argument(
+        "--checked",
+        action="store_true",
+        help="Bounds check every subscript, as debug builds always do, rather "
+        "than only those not proven to be in bounds",
+    )
+    parser.add_argument(
+        "--disable-pass",
+        action="append",
+        default=[],
+        choices=PASSES,
+        metavar="PASS",
+        help=f"Skip an optimisation pass, one of {', '.join(PASSES)} (repeatable)",
+    )
+
+    args = parser.parse_args()
+
+    if args.unity and args.shards:
+        parser.error("--shards can't be combined with --unity")
+
+    return args
+
+
+def prepare_pch(project, py_files, flags=DEFAULT_FLAGS):
+    """ Precompile the union of the project's includes, returning its path. """
+
+    headers = [
+        header_path(replace_top_dir(py_file, cpp_dir, ".cpp")) for py_file in py_files
+    ]
+    path, rebuilt = precompiled_header(
+        os.path.join(cpp_dir, project), collect_includes(headers), flags
+    )
+    print(f"{'Rebuilt' if rebuilt else 'Reused'} precompiled header {path}")
+
+    return path
+
+
+def build_modules(
+    project, py_files, cache, translate, jobs, use_cache, pch, compile, flags
+):
+    """Translate and compile each module separately, reusing cached outputs.
+
+    With pch, every module is translated before anything is compiled so that
+    the shared precompiled header can be built from all of their includes.
+    """
+
+    objects = {}
+    for py_file in py_files:
+        outputs = cache.lookup(py_file, cache.key(py_file)) if use_cache else None
+        if outputs is not None:
+            _, objects[py_file] = outputs
+
+    stale = [py_file for py_file in py_files if py_file not in objects]
+
+    start = time.perf_counter()
+    if pch and stale:
+        results = run_pipeline(stale, translate, None, jobs, imports=module_imports)
+        pch_path = prepare_pch(project, py_files, flags)
+
+        commands = []
+        for result in results:
+            command, result.obj_file = compile_command(
+                result.cpp_file, pch_path, flags
+            )
+            result.log += " ".join(command) + "\n"
+            commands.append(command)
+
+        compiled = compile_all(commands, jobs, compile)
+        for result, (output, elapsed) in zip(results, compiled):
+            result.log += output
+            result.compile_time = elapsed
+    else:
+        command = functools.partial(compile_command, flags=flags)
+        results = run_pipeline(
+            stale, translate, command, jobs, compile, module_imports
+        )
+    wall_time = time.perf_counter() - start
+
+    store_results(results, cache, objects, wall_time)
+
+    return [objects[py_file] for py_file in py_files]
+
+
+def build_shards(
+    project, py_files, cache, translate, jobs, use_cache, pch, compile, flags
+):
+    """Translate modules into shards, then compile every shard in parallel.
+
+    translate must split modules into shards. With the object cache, only
+    the shards whose code changed are recompiled, or all of a module's
+    shards if its header changed.
+    """
+
+    objects = {}
+    for py_file in py_files:
+        outputs = cache.lookup(py_file, cache.key(py_file)) if use_cache else None
+        if outputs is not None:
+            _, objects[py_file] = outputs
+
+    stale = [py_file for py_file in py_files if py_file not in objects]
+
+    start = time.perf_counter()
+    results = run_pipeline(stale, translate, None, jobs, imports=module_imports)
+    pch_path = prepare_pch(project, py_files, flags) if pch and stale else None
+
+    commands = []
+    for result in results:
+        result.obj_file = []
+        for cpp_file in result.cpp_file:
+            command, obj_file = compile_command(cpp_file, pch_path, flags)
+            result.obj_file.append(obj_file)
+            result.log += " ".join(command) + "\n"
+            commands.append(command)
+
+    compiled = iter(compile_all(commands, jobs, compile))
+    for result in results:
+        for _ in result.cpp_file:
+            output, elapsed = next(compiled)
+            result.log += output
+            result.compile_time += elapsed
+    wall_time = time.perf_counter() - start
+
+    store_results(results, cache, objects, wall_time)
+
+    return [obj_file for py_file in py_files for obj_file in objects[py_file]]
+
+
+def store_results(results, cache, objects, wall_time):
+    """ Record freshly built modules in the cache and objects, and report them. """
+
+    for result in results:
+        print(result.log, end="")
+        cache.store(
+            result.py_file,
+            result.cpp_file,
+            result.obj_file,
+            result.imports,
+            generated_paths(result.py_file),
+        )
+        objects[result.py_file] = result.obj_file
+
+    cache.save()
+    print(cache.report())
+    print(format_timings(results, wall_time))
+
+
+def timed_compile(commands, jobs, compile):
+    """ Compile commands, returning the wall time and the total g++ time. """
+
+    start = time.perf_counter()
+    results = compile_all(commands, jobs, compile)
+    wall_time = time.perf_counter() - start
+
+    for output, _ in results:
+        print(output, end="")
+
+    return wall_time, sum(elapsed for _, elapsed in results)
+
+
+def build_unity(
+    project, py_files, translate, units, jobs, compare, pch, compile, flags
+):
+    """Translate every module and compile them merged into a few units.
+
+    Each unit includes the declarations of every module in the project
+    followed by the definitions of its own modules. If compare is set, the
+    modules are also compiled one by one so the difference in g++ time can
+    be reported; both builds then bypass the object cache.
+    """
+
+    results = run_pipeline(py_files, translate, None, jobs)
+    for result in results:
+        print(result.log, end="")
+
+    cpp_files = [result.cpp_file for result in results]
+    pch_path = prepare_pch(project, py_files, flags) if pch else None
+
+    unity_files = []
+    for index, group in enumerate(unity_groups(cpp_files, units)):
+        path = replace_top_dir(f"{py_dir}/{project}/_unity_{index}", cpp_dir, ".cpp")
+        unity_files.append(write_unity_source(path, group, cpp_files))
+
+    commands = [
+        compile_command(unity_file, pch_path, flags) for unity_file in unity_files
+    ]
+    if compare:
+        compile = compile_job
+
+    wall_time, compile_time = timed_compile(
+        [command for command, _ in commands], jobs, compile
+    )
+
+    print(
+        f"Unity build: {len(unity_files)} translation units compiled in "
+        f"{wall_time:.3f}s ({compile_time:.3f}s of g++)"
+    )
+
+    if compare:
+        # Every module sees the project's declarations, as it does in the unity.
+        # They go last so that a precompiled header stays the first include.
+        headers = []
+        for cpp_file in cpp_files:
+            headers.extend(("-include", header_path(cpp_file)))
+
+        module_commands = []
+        for cpp_file in cpp_files:
+            command = compile_command(cpp_file, pch_path, flags)[0]
+            compile_flag = command.index("-c")
+            command[compile_flag:compile_flag] = headers
+            module_commands.append(command)
+        module_wall_time, module_compile_time = timed_compile(
+            module_commands, jobs, compile
+        )
+
+        saved = module_compile_time - compile_time
+        print(
+            f"Per-file build: {len(cpp_files)} objects compiled in "
+            f"{module_wall_time:.3f}s ({module_compile_time:.3f}s of g++)"
+        )
+        print(
+            f"Unity build saved {saved:.3f}s of g++ time "
+            f"({saved / module_compile_time:.1%})"
+        )
+
+    return [obj_file for _, obj_file in commands]
+
+
+def report_profile(py_files, table, json_path):
+    translation_profile = TranslationProfile()
+    for py_file in py_files:
+        module_profile = TranslationProfile.load_json(profile_path(py_file))
+        translation_profile.merge(module_profile)
+
+    if json_path is not None:
+        translation_profile.dump_json(json_path)
+
+    if table:
+        print(translation_profile.table())
+
+
+def bounds_checked(args, build_profile):
+    """ Check whether a build with build_profile keeps every bounds check. """
+
+    return args.checked or build_profile in CHECKED_PROFILES
+
+
+def build_objects(
+    args, py_files, translate, flags, compile, use_cache=True, checked=False
+):
+    """Translate and compile the project with flags, returning its objects.
+
+    With checked, proven safe subscripts keep their bounds checks too.
+    Classes that none of py_files derives from are declared final.
+    """
+
+    project = args.project
+    subclassed = subclassed_names(py_files)
+    translate = functools.partial(translate, checked=checked, subclassed=subclassed)
+
+    if args.unity:
+        return build_unity(
+            project,
+            py_files,
+            translate,
+            args.unity,
+            args.jobs,
+            args.compare,
+            args.pch,
+            compile,
+            flags,
+        )
+
+    # Translation options change the generated code like flags do
+    options = [f"--disable-pass={name}" for name in sorted(set(args.disable_pass))]
+    if args.fast_io:
+        options.append("--fast-io")
+    if args.shards:
+        options.append(f"--shards={args.shards}")
+    if checked:
+        options.append("--checked")
+
+    # Deriving from a class anywhere takes final off it, in a module that
+    # is otherwise unchanged
+    if subclassed:
+        options.append(f"--subclassed={','.join(sorted(subclassed))}")
+
+    cache = BuildCache(os.path.join(cache_dir, f"{project}.json"), (*flags, *options))
+
+    # Profiling needs every module to actually be translated
+    use_cache = use_cache and not (args.no_cache or args.profile or args.profile_json)
+    build_project = build_shards if args.shards else build_modules
+    return build_project(
+        project,
+        py_files,
+        cache,
+        translate,
+        args.jobs,
+        use_cache,
+        args.pch,
+        compile,
+        flags,
+    )
+
+
+def build_pgo(args, py_files, translate, flags):
+    """Build ./main optimised with a profile of the args.pgo training command.
+
+    The objects depend on the recorded profile as well as on their sources,
+    so neither the instrumented nor the final build uses the caches.
+    """
+
+    clear_profile_data(os.path.join(obj_dir, args.project))
+    checked = bounds_checked(args, args.build_profile)
+
+    instrumented = (*flags, *PGO_GENERATE)
+    objects = build_objects(
+        args,
+        py_files,
+        translate,
+        instrumented,
+        compile_job,
+        use_cache=False,
+        checked=checked,
+    )
+    build(objects, instrumented)
+
+    print(f"Training with {args.pgo}")
+    execute(args.pgo)
+
+    optimised = (*flags, *PGO_USE)
+    objects = build_objects(
+        args,
+        py_files,
+        translate,
+        optimised,
+        compile_job,
+        use_cache=False,
+        checked=checked,
+    )
+    build(objects, optimised)
+
+
+def compare_profiles(args, py_files, translate, compile):
+    """ Build ./main with every profile, and with PGO if asked, timing each. """
+
+    runtimes = {}
+    for name, flags in BUILD_PROFILES.items():
+        flags = (*CXXFLAGS, *flags)
+        checked = bounds_checked(args, name)
+        objects = build_objects(
+            args, py_files, translate, flags, compile, checked=checked
+        )
+        build(objects, flags)
+        runtimes[name] = time_command("./main", args.runs)
+
+    if args.pgo is not None:
+        flags = (*CXXFLAGS, *BUILD_PROFILES[args.build_profile])
+        build_pgo(args, py_files, translate, flags)
+        runtimes[f"pgo ({args.build_profile})"] = time_command("./main", args.runs)
+
+    print(format_runtimes(runtimes))
 
 
 def main():
-    project = sys.argv[1]
-    for py_file in find_files(f"{py_dir}/{project}", ".py"):
-        generate_cpp(py_file)
+    args = parse_args()
+    project = args.project
+
+    logging.basicConfig(
+        level=(logging.WARNING, logging.INFO, logging.DEBUG)[min(args.verbose, 2)],
+        format="%(levelname)s %(name)s: %(message)s",
+    )
+
+    profile = args.profile or args.profile_json is not None
+    translate = functools.partial(
+        generate_cpp,
+        profile=profile,
+        fast_io=args.fast_io,
+        passes=[name for name in PASSES if name not in args.disable_pass],
+        stream=args.stream,
+        shards=args.shards,
+        import_root=os.path.join(py_dir, project),
+    )
+
+    py_files = sorted(find_files(f"{py_dir}/{project}", ".py"))
+
+    object_cache = None
+    compile = compile_job
+    if not args.no_object_cache:
+        object_cache = ObjectCache(object_cache_dir, args.object_cache_size << 20)
+        compile = object_cache.compile_job
+
+    flags = (*CXXFLAGS, *BUILD_PROFILES[args.build_profile])
+    try:
+        if args.compare_profiles:
+            compare_profiles(args, py_files, translate, compile)
+            return
 
-    for cpp_file in find_files(f"{cpp_dir}/{project}", ".cpp"):
-        compile_cpp(cpp_file)
+        if args.pgo is not None:
+            build_pgo(args, py_files, translate, flags)
+        else:
+            checked = bounds_checked(args, args.build_profile)
+            objects = build_objects(
+                args, py_files, translate, flags, compile, checked=checked
+            )
+            build(objects, flags)
+    except BuildError as error:
+        sys.exit(f"Build failed: {error}")
+    finally:
+        if object_cache is not None:
+            print(object_cache.report(object_cache.save()))
 
-    build(tuple(find_files(f"{obj_dir}/{project}", ".o")))
+    if profile:
+        report_profile(py_files, args.profile, args.profile_json)
 
     execute("./main")
 
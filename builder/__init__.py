@@ -0,0 +1,27 @@
+from .exceptions import *
+
+from .cache import (
+    BuildCache,
+    read_dependencies,
+    translator_version,
+    write_dependencies,
+)
+from .objects import ObjectCache
+from .pch import PCH_NAME, collect_includes, precompiled_header
+from .profiles import (
+    BUILD_PROFILES,
+    CHECKED_PROFILES,
+    PGO_GENERATE,
+    PGO_USE,
+    clear_profile_data,
+    format_runtimes,
+    time_command,
+)
+from .pipeline import (
+    ModuleResult,
+    compile_all,
+    compile_job,
+    format_timings,
+    run_pipeline,
+)
+from .unity import header_path, shard_paths, unity_groups, write_unity_source
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+
+
+def hash_file(path, digest=None):
+    """ Feed the contents of path into digest, creating a sha256 if needed. """
+
+    if digest is None:
+        digest = hashlib.sha256()
+
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(1 << 16), b""):
+            digest.update(chunk)
+
+    return digest
+
+
+def translator_version():
+    """Hash the sources of the compiler package.
+
+    Any edit to the translator changes this value and so invalidates every
+    cached translation made by the previous version.
+    """
+
+    # Imported here so that thin clients of the builder don't pay for it
+    import compiler
+
+    package_dir = os.path.dirname(os.path.abspath(compiler.__file__))
+
+    digest = hashlib.sha256()
+    for file_name in sorted(os.listdir(package_dir)):
+        if file_name.endswith(".py"):
+            digest.update(file_name.encode())
+            hash_file(os.path.join(package_dir, file_name), digest)
+
+    return digest.hexdigest()
+
+
+def write_dependencies(path, py_files):
+    """ Record the project modules a translated module imports, one per line. """
+
+    with open(path, "w") as dependency_file:
+        dependency_file.writelines(f"{py_file}\n" for py_file in py_files)
+
+
+def read_dependencies(path):
+    try:
+        with open(path, "r") as dependency_file:
+            return dependency_file.read().split("\n")[:-1]
+    except FileNotFoundError:
+        return []
+
+
+def output_paths(entry):
+    for output in ("cpp", "obj", "generated"):
+        paths = entry[output]
+        if isinstance(paths, str):
+            yield paths
+        else:
+            yield from paths
+
+
+class BuildCache:
+    """Persistent record of which modules were translated and compiled.
+
+    Entries are keyed on the python source path and store a hash of the
+    source, the translator version and the compiler flags. A module whose
+    hash is unchanged and whose outputs still exist can skip both the
+    translation and the `g++ -c` step. The outputs of a sharded module are
+    lists of the sources and objects of its shards. The other files that
+    translating a module generates, such as its header, are outputs too.
+
+    Each entry also lists the project modules that the module imported, and
+    the sources of everything it imports, directly or not, are part of its
+    hash. Changing a module so rebuilds its dependents along with it.
+    """
+
+    def __init__(self, path, flags=()):
+        self.path = path
+        self.flags = tuple(flags)
+        self.version = translator_version()
+
+        self.entries = {}
+        self.reused = []
+        self.rebuilt = []
+
+        # Hash of each source read so far
+        self.hashes = {}
+
+        try:
+            with open(self.path, "r") as cache_file:
+                self.entries = json.load(cache_file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def source_hash(self, py_file):
+        source_hash = self.hashes.get(py_file)
+        if source_hash is None:
+            try:
+                source_hash = hash_file(py_file).hexdigest()
+            except FileNotFoundError:
+                source_hash = ""
+
+            self.hashes[py_file] = source_hash
+
+        return source_hash
+
+    def dependencies(self, py_file):
+        """Get the project modules py_file imports, directly or not.
+
+        These are the imports recorded when each module was last built, which
+        are still right for every module whose source hasn't changed since.
+        """
+
+        found = set()
+        pending = [py_file]
+        while pending:
+            entry = self.entries.get(pending.pop())
+            for module in entry.get("imports", ()) if entry else ():
+                if module not in found and module != py_file:
+                    found.add(module)
+                    pending.append(module)
+
+        return sorted(found)
+
+    def key(self, py_file):
+        digest = hashlib.sha256()
+        digest.update(self.version.encode())
+        digest.update("\0".join(self.flags).encode())
+
+        for module in (py_file, *self.dependencies(py_file)):
+            digest.update(f"\0{module}\0{self.source_hash(module)}".encode())
+
+        return digest.hexdigest()
+
+    def lookup(self, py_file, key):
+        """ Get the (cpp, obj) outputs of py_file if they are still valid. """
+
+        entry = self.entries.get(py_file)
+        if entry is None or entry["key"] != key:
+            return None
+
+        if not all(os.path.exists(path) for path in output_paths(entry)):
+            return None
+
+        self.reused.append(py_file)
+        return entry["cpp"], entry["obj"]
+
+    def store(self, py_file, cpp_file, obj_file, imports=(), generated=()):
+        """Record the outputs of a freshly built module and what it imports.
+
+        generated lists the paths of the module's other outputs. Its key is
+        only worked out by save(), once the imports of every module rebuilt
+        alongside it are known too.
+        """
+
+        self.entries[py_file] = {
+            "cpp": cpp_file,
+            "obj": obj_file,
+            "imports": list(imports),
+            "generated": list(generated),
+        }
+        self.rebuilt.append(py_file)
+
+    def save(self):
+        for py_file in self.rebuilt:
+            self.entries[py_file]["key"] = self.key(py_file)
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        with open(self.path, "w") as cache_file:
+            json.dump(self.entries, cache_file, indent=2, sort_keys=True)
+
+    def report(self):
+        total = len(self.reused) + len(self.rebuilt)
+        lines = [f"Reused {len(self.reused)}/{total} modules from the build cache"]
+        lines.extend(f"    reused:  {py_file}" for py_file in self.reused)
+        lines.extend(f"    rebuilt: {py_file}" for py_file in self.rebuilt)
+
+        return "\n".join(lines)
@@ -0,0 +1,149 @@
+import json
+import os
+import socket
+import socketserver
+import time
+
+from .cache import translator_version
+from .exceptions import BuildError
+
+SOCKET_PATH = os.path.join(".build_cache", "translate.sock")
+
+
+class TranslationHandler(socketserver.StreamRequestHandler):
+    """ Handle one newline terminated JSON request from a client. """
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline())
+            response = self.server.respond(message)
+        except ValueError as error:
+            response = {"error": f"Malformed request: {error}"}
+
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class TranslationServer(socketserver.UnixStreamServer):
+    """Long running process that keeps the translator imported and warm.
+
+    translate(source, output) is called for every pair of paths a client
+    sends. When the sources of the compiler package change the server stops
+    rather than keep serving translations from stale code.
+    """
+
+    def __init__(self, path, translate):
+        self.translate = translate
+        self.version = translator_version()
+        self.running = True
+
+        super().__init__(path, TranslationHandler)
+
+    def respond(self, message):
+        command = message.get("command")
+
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid()}
+
+        if command == "stop":
+            self.running = False
+            return {"ok": True}
+
+        if command != "translate":
+            return {"error": f"Unknown command {command!r}"}
+
+        if translator_version() != self.version:
+            self.running = False
+            return {"error": "The translator has changed, the daemon is stopping"}
+
+        cwd = message.get("cwd", os.getcwd())
+
+        results = []
+        for source, output in message["files"]:
+            start = time.perf_counter()
+            error = None
+            try:
+                self.translate(os.path.join(cwd, source), os.path.join(cwd, output))
+            except Exception as exception:
+                error = f"{type(exception).__name__}: {exception}"
+
+            results.append(
+                {
+                    "source": source,
+                    "output": output,
+                    "error": error,
+                    "time": time.perf_counter() - start,
+                }
+            )
+
+        ok = all(result["error"] is None for result in results)
+
+        return {"ok": ok, "results": results}
+
+    def serve(self):
+        while self.running:
+            self.handle_request()
+
+
+def serve(translate, path=SOCKET_PATH):
+    """ Run a translation daemon on the unix socket at path until stopped. """
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    if os.path.exists(path):
+        try:
+            request({"command": "ping"}, path)
+        except OSError:
+            os.unlink(path)
+        else:
+            raise BuildError(f"A translation daemon is already listening on {path}")
+
+    with TranslationServer(path, translate) as server:
+        try:
+            server.serve()
+        finally:
+            os.unlink(path)
+
+
+def request(message, path=SOCKET_PATH):
+    """Send a message to the daemon listening at path and return its reply.
+
+    Raises OSError when no daemon is running.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(json.dumps(message).encode() + b"\n")
+
+        with client.makefile("rb") as reply:
+            return json.loads(reply.readline())
+
+
+def watch(root, on_change, extension=".py", interval=0.25):
+    """Poll root for files with extension and report the ones that changed.
+
+    on_change is called with the sorted list of paths whose modification
+    time differs from the previous poll. Every file counts as changed on the
+    first poll.
+    """
+
+    mtimes = {}
+    while True:
+        seen = {}
+        for dirpath, _, filenames in os.walk(root):
+            for file_name in filenames:
+                if os.path.splitext(file_name)[1] == extension:
+                    path = os.path.join(dirpath, file_name)
+                    try:
+                        seen[path] = os.stat(path).st_mtime_ns
+                    except FileNotFoundError:
+                        continue
+
+        changed = sorted(
+            path for path, mtime in seen.items() if mtimes.get(path) != mtime
+        )
+        mtimes = seen
+
+        if changed:
+            on_change(changed)
+
+        time.sleep(interval)
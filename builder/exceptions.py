@@ -0,0 +1,2 @@
+class BuildError(Exception):
+    """ Raised when a translation or an external build step fails. """
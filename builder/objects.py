@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+from .cache import hash_file
+from .pipeline import compile_job
+
+# Default bound on the total size of the stored objects
+MAX_SIZE = 512 * 1024 * 1024
+
+LOCAL_INCLUDE = re.compile(r'^\s*#\s*include\s+"([^"]+)"', re.MULTILINE)
+
+
+class ObjectCache:
+    """Local store of compiled objects, in the spirit of ccache.
+
+    Objects are keyed on a hash of the compiler version, the compiler flags,
+    the c++ source and every project file it includes. The store lives
+    outside of the obj/ tree, so it is shared between projects and survives
+    `make clean`. Files are touched whenever they are used and the least
+    recently used ones are evicted once the store grows past max_size bytes.
+    """
+
+    def __init__(self, directory, max_size=MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.stats_path = os.path.join(directory, "stats.json")
+
+        self.versions = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def compiler_version(self, compiler):
+        with self.lock:
+            version = self.versions.get(compiler)
+
+        if version is None:
+            process = subprocess.run(
+                [compiler, "--version"], stdout=subprocess.PIPE, text=True
+            )
+            version = process.stdout
+
+            with self.lock:
+                self.versions[compiler] = version
+
+        return version
+
+    def hash_sources(self, path, digest, seen):
+        """ Hash path and, recursively, the project files it includes. """
+
+        path = os.path.normpath(path)
+        if path in seen or not os.path.exists(path):
+            return
+
+        seen.add(path)
+        hash_file(path, digest)
+        digest.update(b"\0")
+
+        with open(path, "r") as source:
+            included = LOCAL_INCLUDE.findall(source.read())
+
+        directory = os.path.dirname(path)
+        for include in included:
+            self.hash_sources(os.path.join(directory, include), digest, seen)
+
+    def key(self, command):
+        """Hash a `g++ ... -c -o OBJ SOURCE` command.
+
+        Only the contents of the source and of files passed with -include are
+        hashed, not their paths, so that identical code compiled for different
+        projects or into different objects shares one entry.
+        """
+
+        digest = hashlib.sha256()
+        digest.update(self.compiler_version(command[0]).encode())
+
+        seen = set()
+        arguments = iter(command[1:-1])
+        for argument in arguments:
+            if argument == "-o":
+                next(arguments)
+                continue
+
+            digest.update(f"{argument}\0".encode())
+            if argument == "-include":
+                self.hash_sources(next(arguments), digest, seen)
+
+        self.hash_sources(command[-1], digest, seen)
+
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.o")
+
+    def compile_job(self, command):
+        """Drop in replacement for pipeline.compile_job backed by the store.
+
+        On a hit the stored object is copied to the command's output instead
+        of running the compiler.
+        """
+
+        start = time.perf_counter()
+
+        key = self.key(command)
+        stored = self.path(key)
+        obj_file = command[command.index("-o") + 1]
+
+        try:
+            shutil.copyfile(stored, obj_file)
+        except FileNotFoundError:
+            pass
+        else:
+            os.utime(stored)
+            with self.lock:
+                self.hits += 1
+
+            return 0, "", time.perf_counter() - start
+
+        status, output, _ = compile_job(command)
+
+        with self.lock:
+            self.misses += 1
+
+        if status == 0:
+            os.makedirs(os.path.dirname(stored), exist_ok=True)
+
+            # Copy then rename, so that a concurrent build never sees half
+            # of an object
+            partial = f"{stored}.{os.getpid()}.{threading.get_ident()}"
+            shutil.copyfile(obj_file, partial)
+            os.replace(partial, stored)
+
+        return status, output, time.perf_counter() - start
+
+    def entries(self):
+        for dirpath, _, filenames in os.walk(self.directory):
+            for file_name in filenames:
+                if file_name.endswith(".o"):
+                    path = os.path.join(dirpath, file_name)
+                    stat = os.stat(path)
+                    yield stat.st_mtime, stat.st_size, path
+
+    def trim(self):
+        """ Evict least recently used objects until the store fits max_size. """
+
+        entries = sorted(self.entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+
+        evicted = 0
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+
+            os.unlink(path)
+            size -= entry_size
+            evicted += 1
+
+        return size, evicted
+
+    def save(self):
+        """ Trim the store and add this run's hits and misses to its totals. """
+
+        size, evicted = self.trim()
+
+        try:
+            with open(self.stats_path, "r") as stats_file:
+                stats = json.load(stats_file)
+        except (OSError, ValueError):
+            stats = {}
+
+        for name, count in (
+            ("hits", self.hits),
+            ("misses", self.misses),
+            ("evictions", evicted),
+        ):
+            stats[name] = stats.get(name, 0) + count
+        stats["size"] = size
+
+        with open(self.stats_path, "w") as stats_file:
+            json.dump(stats, stats_file, indent=2, sort_keys=True)
+
+        return stats
+
+    def report(self, stats):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+
+        total_lookups = stats["hits"] + stats["misses"]
+        total_rate = stats["hits"] / total_lookups if total_lookups else 0.0
+
+        return (
+            f"Object cache: {self.hits} hits, {self.misses} misses ({rate:.0%}); "
+            f"all time {stats['hits']} hits, {stats['misses']} misses "
+            f"({total_rate:.0%}), {stats['evictions']} evicted; "
+            f"{stats['size'] / 1024 / 1024:.2f}/{self.max_size / 1024 / 1024:.0f} MB"
+        )
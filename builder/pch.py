@@ -0,0 +1,61 @@
+import hashlib
+import os
+
+from .pipeline import compile_all
+
+PCH_NAME = "_pch.hpp"
+
+
+def collect_includes(header_files):
+    """ Get the union of the system headers included by header_files. """
+
+    includes = set()
+    for header_file in header_files:
+        try:
+            with open(header_file, "r") as header:
+                for line in header:
+                    if line.startswith("#include <"):
+                        includes.add(line.split(None, 1)[1].strip())
+        except FileNotFoundError:
+            continue
+
+    return includes
+
+
+def precompiled_header(directory, includes, flags=()):
+    """Make sure a precompiled header of includes exists in directory.
+
+    The header is only regenerated and recompiled when the set of includes
+    or the compiler flags differ from the ones it was last built with.
+    Returns the path of the header, to be passed to g++ with -include, and
+    whether it had to be rebuilt.
+    """
+
+    path = os.path.join(directory, PCH_NAME)
+    key_path = f"{path}.key"
+
+    digest = hashlib.sha256()
+    digest.update("\0".join(flags).encode())
+    digest.update("\0".join(sorted(includes)).encode())
+    key = digest.hexdigest()
+
+    try:
+        with open(key_path, "r") as key_file:
+            up_to_date = key_file.read() == key and os.path.exists(f"{path}.gch")
+    except FileNotFoundError:
+        up_to_date = False
+
+    if up_to_date:
+        return path, False
+
+    with open(path, "w") as header:
+        header.write("#pragma once\n")
+        for include in sorted(includes):
+            header.write(f"#include {include}\n")
+
+    compile_all([["g++", *flags, "-x", "c++-header", "-o", f"{path}.gch", path]])
+
+    with open(key_path, "w") as key_file:
+        key_file.write(key)
+
+    return path, True
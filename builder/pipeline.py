@@ -0,0 +1,217 @@
+import contextlib
+import io
+import subprocess
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from .exceptions import BuildError
+
+
+class ModuleResult:
+    """ Outputs, captured logs and timings for one module of a build. """
+
+    def __init__(self, py_file):
+        self.py_file = py_file
+        self.cpp_file = None
+        self.obj_file = None
+        self.imports = []
+        self.log = ""
+        self.translate_time = 0.0
+        self.compile_time = 0.0
+
+
+def translate_job(translate, py_file):
+    """Run translate(py_file) in a worker process.
+
+    Anything the translator prints is captured so that the parent can replay
+    it in a deterministic order.
+    """
+
+    start = time.perf_counter()
+
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        cpp_file = translate(py_file)
+
+    return cpp_file, log.getvalue(), time.perf_counter() - start
+
+
+def compile_job(command):
+    """ Run a compiler command, returning its status, output and duration. """
+
+    start = time.perf_counter()
+    process = subprocess.run(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+
+    return process.returncode, process.stdout, time.perf_counter() - start
+
+
+def release(waiting, py_file):
+    """Stop modules in waiting from waiting for the translation of py_file.
+
+    Returns the modules that were waiting on nothing else.
+    """
+
+    ready = []
+    for module, dependencies in list(waiting.items()):
+        dependencies.discard(py_file)
+        if not dependencies:
+            del waiting[module]
+            ready.append(module)
+
+    return ready
+
+
+def run_pipeline(
+    py_files,
+    translate,
+    compile_command,
+    jobs=1,
+    compile=compile_job,
+    imports=None,
+):
+    """Translate and compile py_files using up to jobs workers of each kind.
+
+    translate(py_file) runs in a process pool and returns the path of the
+    generated c++. compile_command(cpp_file) returns the argv of the compiler
+    and the path of the object it produces; each compile is started as soon
+    as its translation finishes, by calling compile(command) in a thread
+    pool. If compile_command is None the modules are only translated.
+
+    imports(py_file), if given, lists the project modules a translated module
+    imports. Its compile then also waits for those among py_files to be
+    translated, as it includes their headers.
+
+    Results are returned in the order of py_files. The first failure cancels
+    all outstanding work and is raised as a BuildError.
+    """
+
+    results = {py_file: ModuleResult(py_file) for py_file in py_files}
+
+    # Modules waiting to be compiled, with the translations they wait for
+    waiting = {}
+    translated = set()
+
+    def start_compile(py_file):
+        result = results[py_file]
+        command, result.obj_file = compile_command(result.cpp_file)
+        result.log += " ".join(command) + "\n"
+        pending[compilers.submit(compile, command)] = ("compile", py_file)
+
+    with ProcessPoolExecutor(max_workers=jobs) as translators, ThreadPoolExecutor(
+        max_workers=jobs
+    ) as compilers:
+        pending = {}
+        for py_file in py_files:
+            future = translators.submit(translate_job, translate, py_file)
+            pending[future] = ("translate", py_file)
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in sorted(done, key=lambda future: pending[future][1]):
+                    stage, py_file = pending.pop(future)
+                    result = results[py_file]
+
+                    if stage == "translate":
+                        try:
+                            cpp_file, log, elapsed = future.result()
+                        except Exception as error:
+                            raise BuildError(
+                                f"Translating {py_file} failed: {error}"
+                            ) from error
+
+                        result.cpp_file = cpp_file
+                        result.log += log
+                        result.translate_time = elapsed
+
+                        if imports is not None:
+                            result.imports = imports(py_file)
+
+                        translated.add(py_file)
+                        if compile_command is None:
+                            continue
+
+                        waiting[py_file] = {
+                            module
+                            for module in result.imports
+                            if module in results and module not in translated
+                        }
+                        for module in release(waiting, py_file):
+                            start_compile(module)
+                    else:
+                        status, output, elapsed = future.result()
+
+                        result.log += output
+                        result.compile_time = elapsed
+
+                        if status != 0:
+                            raise BuildError(
+                                f"Compiling {result.cpp_file} failed "
+                                f"with status {status}:\n{output}"
+                            )
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            translators.shutdown(cancel_futures=True)
+            compilers.shutdown(cancel_futures=True)
+            raise
+
+    return [results[py_file] for py_file in py_files]
+
+
+def compile_all(commands, jobs=1, compile=compile_job):
+    """Run compiler commands in a pool of up to jobs subprocesses.
+
+    Returns the output and duration of each command, in order. Raises a
+    BuildError for the first command that fails.
+    """
+
+    with ThreadPoolExecutor(max_workers=jobs) as compilers:
+        futures = [compilers.submit(compile, command) for command in commands]
+
+        results = []
+        for command, future in zip(commands, futures):
+            status, output, elapsed = future.result()
+
+            if status != 0:
+                for pending in futures:
+                    pending.cancel()
+
+                raise BuildError(
+                    f"{' '.join(command)!r} failed with status {status}:\n{output}"
+                )
+
+            results.append((output, elapsed))
+
+    return results
+
+
+def format_timings(results, wall_time):
+    """ Summarise per-module and total timings of a pipeline run. """
+
+    lines = []
+    for result in results:
+        lines.append(
+            f"    {result.py_file}: translate {result.translate_time:.3f}s, "
+            f"compile {result.compile_time:.3f}s"
+        )
+
+    translate_total = sum(result.translate_time for result in results)
+    compile_total = sum(result.compile_time for result in results)
+    lines.append(
+        f"Built {len(results)} modules in {wall_time:.3f}s "
+        f"(translate {translate_total:.3f}s, compile {compile_total:.3f}s of work)"
+    )
+
+    return "\n".join(lines)
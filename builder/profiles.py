@@ -0,0 +1,57 @@
+import glob
+import os
+import subprocess
+import time
+
+from .exceptions import BuildError
+
+# g++ flags of each named build profile, used for both compiling and linking
+BUILD_PROFILES = {
+    "debug": ("-O0", "-g"),
+    "release": ("-O2",),
+    "aggressive": ("-O3", "-march=native", "-flto"),
+}
+
+# Profiles that keep the bounds check of every subscript, even proven safe ones
+CHECKED_PROFILES = ("debug",)
+
+PGO_GENERATE = ("-fprofile-generate",)
+
+# Modules the training run never reached have no profile, which is fine
+PGO_USE = ("-fprofile-use", "-fprofile-correction", "-Wno-missing-profile")
+
+
+def clear_profile_data(directory):
+    """ Remove the .gcda files left in directory by earlier training runs. """
+
+    pattern = os.path.join(directory, "**", "*.gcda")
+    for path in glob.glob(pattern, recursive=True):
+        os.remove(path)
+
+
+def time_command(command, runs=3):
+    """ Run command runs times with its output discarded, keeping the best time. """
+
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run(command, shell=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+
+        if process.returncode != 0:
+            raise BuildError(f"{command!r} exited with status {process.returncode}")
+
+    return best
+
+
+def format_runtimes(runtimes):
+    """ Tabulate the best runtime of each profile against the first one. """
+
+    baseline = next(iter(runtimes.values()))
+    width = max(len("profile"), *(len(name) for name in runtimes))
+
+    lines = [f"{'profile':<{width}}  {'runtime (s)':>11}  {'speedup':>8}"]
+    for name, runtime in runtimes.items():
+        lines.append(f"{name:<{width}}  {runtime:>11.3f}  {baseline / runtime:>7.2f}x")
+
+    return "\n".join(lines)
@@ -0,0 +1,59 @@
+import os
+
+
+def header_path(cpp_file):
+    """ Get the path of the declarations header generated next to cpp_file. """
+
+    return f"{os.path.splitext(cpp_file)[0]}.hpp"
+
+
+def shard_paths(cpp_file, count):
+    """ Get the paths of the count shards that cpp_file is split into. """
+
+    name = os.path.splitext(cpp_file)[0]
+    return [f"{name}.{index}.cpp" for index in range(count)]
+
+
+def unity_groups(cpp_files, count):
+    """ Split cpp_files into at most count contiguous, similarly sized groups. """
+
+    count = max(1, min(count, len(cpp_files)))
+    size, extra = divmod(len(cpp_files), count)
+
+    groups = []
+    start = 0
+    for index in range(count):
+        end = start + size + (index < extra)
+        groups.append(cpp_files[start:end])
+        start = end
+
+    return groups
+
+
+def write_unity_source(path, cpp_files, declared=None):
+    """Write a translation unit at path that includes all of cpp_files.
+
+    The headers of every module in declared (by default just cpp_files) are
+    included before any definitions, so modules may call each other's
+    functions regardless of the order or unit they are merged into.
+    """
+
+    if declared is None:
+        declared = cpp_files
+
+    directory = os.path.dirname(path)
+
+    def relative(file_path):
+        return os.path.relpath(file_path, directory)
+
+    with open(path, "w") as unity_file:
+        unity_file.write(f"// Unity build of {len(cpp_files)} modules\n")
+
+        for cpp_file in declared:
+            unity_file.write(f'#include "{relative(header_path(cpp_file))}"\n')
+
+        unity_file.write("\n")
+        for cpp_file in cpp_files:
+            unity_file.write(f'#include "{relative(cpp_file)}"\n')
+
+    return path
@@ -1,9 +1,18 @@
 from .exceptions import *
 
 from .data_map import (
+    INCLUDES,
+    LAYOUTS,
+    POINTER_LAYOUT,
+    TYPE_LAYOUTS,
     UnknownTypeError,
     get_exception_type,
     get_operator,
+    get_precedence,
     get_type,
+    list_element_type,
+    list_type,
     TYPES,
 )
+
+from .profile import TranslationProfile
@@ -0,0 +1,280 @@
+import ast
+from ast import (
+    Add,
+    AnnAssign,
+    Assign,
+    Attribute,
+    AugAssign,
+    Break,
+    Call,
+    Compare,
+    Constant,
+    Continue,
+    Expr,
+    For,
+    JoinedStr,
+    List,
+    Lt,
+    LtE,
+    Mult,
+    Name,
+    Raise,
+    Return,
+    Store,
+    UnaryOp,
+    USub,
+)
+
+# Statements that run exactly once each time the block they are in runs
+STRAIGHT_LINE = (Expr, Assign, AnnAssign, AugAssign)
+
+# Statements that can leave a loop's body before its end
+EXITS = (Break, Continue, Raise, Return)
+
+
+def simple_value(node):
+    """ Get the c++ text of a name or integer constant, otherwise None. """
+
+    if isinstance(node, Name):
+        return node.id
+
+    if isinstance(node, Constant) and type(node.value) is int:
+        return str(node.value)
+
+    if isinstance(node, UnaryOp) and isinstance(node.op, USub):
+        operand = node.operand
+        if isinstance(operand, Constant) and type(operand.value) is int:
+            return str(-operand.value)
+
+    return None
+
+
+def integer_value(node):
+    """ Get the value of an integer literal, which may be negative. """
+
+    value = simple_value(node)
+    if value is None or isinstance(node, Name):
+        return None
+
+    return int(value)
+
+
+def repeated_list(node):
+    """Get the element and count of a list built as `[element] * count`.
+
+    The count may also come first. Returns None for any other expression.
+    """
+
+    if not (isinstance(node, ast.BinOp) and isinstance(node.op, Mult)):
+        return None
+
+    for sequence, count in ((node.left, node.right), (node.right, node.left)):
+        if isinstance(sequence, List) and len(sequence.elts) == 1:
+            if not isinstance(count, List):
+                return sequence.elts[0], count
+
+    return None
+
+
+def literal_length(node):
+    """ Get the number of utf-8 bytes of literal text in a string expression. """
+
+    if isinstance(node, Constant) and isinstance(node.value, str):
+        return len(node.value.encode())
+
+    if isinstance(node, JoinedStr):
+        return sum(literal_length(value) for value in node.values)
+
+    if isinstance(node, ast.BinOp) and isinstance(node.op, Add):
+        return literal_length(node.left) + literal_length(node.right)
+
+    return 0
+
+
+def appended_lengths(body):
+    """Find the variables a loop body appends text to every time it runs.
+
+    Only `name += ...` statements directly in the body count, and only their
+    literal text, so the lengths returned are the least number of bytes each
+    iteration adds to each name. Names with no literal text are left out.
+    """
+
+    lengths = {}
+    for statement in body:
+        if (
+            isinstance(statement, AugAssign)
+            and isinstance(statement.op, Add)
+            and isinstance(statement.target, Name)
+        ):
+            name = statement.target.id
+            lengths[name] = lengths.get(name, 0) + literal_length(statement.value)
+
+    return {name: length for name, length in lengths.items() if length}
+
+
+def loop_appends(node):
+    """Find the lists a for loop appends to on every iteration.
+
+    Returns a mapping of list names to the number of `name.append(...)`
+    statements directly in the body, leaving out the sequence iterated over.
+    Returns an empty one if the body could end an iteration early.
+    """
+
+    for statement in node.body:
+        for child in ast.walk(statement):
+            if isinstance(child, EXITS):
+                return {}
+
+    appends = {}
+    for statement in node.body:
+        name = appended_name(statement)
+        if name is not None:
+            appends[name] = appends.get(name, 0) + 1
+
+    iterable = node.iter
+    if isinstance(iterable, Name):
+        appends.pop(iterable.id, None)
+
+    return appends
+
+
+def loop_trips(node):
+    """Get, as c++ source, the number of times a for loop runs.
+
+    Handles loops over a named sequence, and over range() given up to two
+    names or integer constants. Returns the condition under which the loop
+    runs at all, None if there is none to check, and its trip count. Returns
+    None for any other loop.
+    """
+
+    iterable = node.iter
+    if isinstance(iterable, Name):
+        return None, f"{iterable.id}.size()"
+
+    if not (
+        isinstance(node, For)
+        and isinstance(iterable, Call)
+        and isinstance(iterable.func, Name)
+        and iterable.func.id == "range"
+        and 1 <= len(iterable.args) <= 2
+        and not iterable.keywords
+    ):
+        return None
+
+    args = iterable.args
+    start, stop = (Constant(0), *args) if len(args) == 1 else args
+
+    values = integer_value(start), integer_value(stop)
+    if None not in values:
+        return None, str(max(values[1] - values[0], 0))
+
+    start, stop = simple_value(start), simple_value(stop)
+    if None in (start, stop):
+        return None
+
+    if start == "0":
+        return f"0 < {stop}", stop
+
+    return f"{start} < {stop}", f"{stop} - {start}"
+
+
+def assigns(body, name):
+    """ Check whether any statement in body stores to the variable name. """
+
+    for statement in body:
+        for node in ast.walk(statement):
+            if (
+                isinstance(node, Name)
+                and node.id == name
+                and isinstance(node.ctx, Store)
+            ):
+                return True
+
+    return False
+
+
+def assigned_names(statement):
+    if isinstance(statement, Assign):
+        targets = statement.targets
+    else:
+        targets = [statement.target]
+
+    return {target.id for target in targets if isinstance(target, Name)}
+
+
+def appended_name(statement):
+    """ Get the name of the list appended to by `name.append(...)`, if any. """
+
+    if not isinstance(statement, Expr):
+        return None
+
+    call = statement.value
+    if not (isinstance(call, Call) and isinstance(call.func, Attribute)):
+        return None
+
+    func = call.func
+    if func.attr == "append" and isinstance(func.value, Name):
+        return func.value.id
+
+    return None
+
+
+def counted_appends(node):
+    """Find lists that grow by a known amount over a while loop.
+
+    Recognises loops of the form `while counter < bound:` (or `<=`) whose
+    body is straight-line code that increments counter by one and appends to
+    some lists. Returns, as c++ source, the condition under which the loop
+    runs at all and its trip count, along with a mapping of list names to
+    the number of appends per iteration. Returns None for any other loop.
+    """
+
+    test = node.test
+    if not (
+        isinstance(test, Compare)
+        and len(test.ops) == 1
+        and isinstance(test.ops[0], (Lt, LtE))
+        and isinstance(test.left, Name)
+    ):
+        return None
+
+    counter = test.left.id
+    bound = simple_value(test.comparators[0])
+    if bound is None or bound == counter:
+        return None
+
+    appends = {}
+    steps = 0
+    for statement in node.body:
+        if not isinstance(statement, STRAIGHT_LINE):
+            return None
+
+        if isinstance(statement, AugAssign):
+            target = statement.target
+            if isinstance(target, Name) and target.id == bound:
+                return None
+
+            if isinstance(target, Name) and target.id == counter:
+                value = statement.value
+                if not (
+                    isinstance(statement.op, Add)
+                    and isinstance(value, Constant)
+                    and value.value == 1
+                ):
+                    return None
+
+                steps += 1
+        elif isinstance(statement, Expr):
+            name = appended_name(statement)
+            if name is not None:
+                appends[name] = appends.get(name, 0) + 1
+        elif {counter, bound} & assigned_names(statement):
+            return None
+
+    if steps != 1 or not appends:
+        return None
+
+    if isinstance(test.ops[0], Lt):
+        return f"{counter} < {bound}", f"{bound} - {counter}", appends
+
+    return f"{counter} <= {bound}", f"{bound} - {counter} + 1", appends
@@ -0,0 +1,324 @@
+import ast
+from ast import (
+    Add,
+    AnnAssign,
+    Assign,
+    Attribute,
+    AugAssign,
+    BinOp,
+    Call,
+    ClassDef,
+    Constant,
+    Del,
+    For,
+    FunctionDef,
+    Lambda,
+    List,
+    Mult,
+    Name,
+    Slice,
+    Store,
+    Sub,
+    Subscript,
+    UnaryOp,
+)
+
+from compiler.analysis import assigns, integer_value, repeated_list
+from compiler.inference import function_nodes
+
+# Nodes of expressions whose value depends only on the names in them
+INVARIANT_NODES = (
+    BinOp,
+    Constant,
+    Name,
+    UnaryOp,
+    ast.expr_context,
+    ast.operator,
+    ast.unaryop,
+)
+
+# Methods that change the length of the list they are called on
+RESIZING_METHODS = frozenset(("append", "clear", "extend", "insert", "pop", "remove"))
+
+
+def length_of(node):
+    """ Get the name of the sequence measured by `len(name)`, if node is that. """
+
+    if (
+        isinstance(node, Call)
+        and isinstance(node.func, Name)
+        and node.func.id == "len"
+        and len(node.args) == 1
+        and not node.keywords
+        and isinstance(node.args[0], Name)
+    ):
+        return node.args[0].id
+
+    return None
+
+
+def expression_key(node):
+    """ Get a key that is equal for structurally equal expressions. """
+
+    if isinstance(node, Name):
+        return "name", node.id
+
+    name = length_of(node)
+    if name is not None:
+        return "len", name
+
+    return "expression", ast.dump(node)
+
+
+def linear(node):
+    """Split an integer expression into a base and a constant offset.
+
+    The base is an expression_key(), or None when node is a constant: i - 1
+    gives (key of i, -1) and 5 gives (None, 5).
+    """
+
+    value = integer_value(node)
+    if value is not None:
+        return None, value
+
+    shift = 0
+    if isinstance(node, BinOp) and isinstance(node.op, (Add, Sub)):
+        value = integer_value(node.right)
+        if value is not None:
+            shift = value if isinstance(node.op, Add) else -value
+            node = node.left
+
+    return expression_key(node), shift
+
+
+def index_of(node):
+    # Python < 3.9 wraps the index in an ast.Index node
+    slice_ = node.slice
+    return slice_.value if isinstance(slice_, ast.Index) else slice_
+
+
+class SafeSubscripts:
+    """Find the subscripts of a function's lists that can't be out of bounds.
+
+    A list qualifies if the function never resizes or rebinds it, beyond
+    creating it once. Its length is then len() of it throughout, or the
+    constant or count it was created with when that is a list literal or
+    `[value] * count`, and count depends only on names the function never
+    assigns.
+
+    An index is safe when it is a constant below that length, or the counter
+    of an enclosing `for counter in range(start, stop, step)`, plus or minus
+    a constant, where the body never assigns counter, step is positive, and
+    start and stop keep the index within the list. Like the translation of
+    arithmetic generally, this assumes that ints never overflow.
+    """
+
+    def __init__(self, function):
+        nodes = function_nodes(function)
+        self.parameters = {arg.arg for arg in function.args.args}
+
+        # Number of times each name is stored to, and the lists resized
+        self.stores = {}
+        self.resized = set()
+        for node in nodes:
+            if isinstance(node, Name) and isinstance(node.ctx, Store):
+                self.stores[node.id] = self.stores.get(node.id, 0) + 1
+            elif isinstance(node, Call) and isinstance(node.func, Attribute):
+                if node.func.attr in RESIZING_METHODS:
+                    self.resize(node.func.value)
+            elif isinstance(node, AugAssign):
+                self.resize(node.target)
+            elif isinstance(node, Subscript) and (
+                isinstance(node.ctx, Del) or isinstance(index_of(node), Slice)
+            ):
+                self.resize(node.value)
+
+        # Lengths known beyond len(), as linear() pairs
+        self.sizes = {}
+        for node in nodes:
+            if isinstance(node, Assign) and len(node.targets) == 1:
+                target = node.targets[0]
+            elif isinstance(node, AnnAssign) and node.value is not None:
+                target = node.target
+            else:
+                continue
+
+            if not isinstance(target, Name):
+                continue
+
+            name = target.id
+            if not self.stable(name) or self.stores.get(name) != 1:
+                continue
+
+            if isinstance(node.value, List):
+                self.sizes[name] = None, len(node.value.elts)
+                continue
+
+            repeated = repeated_list(node.value)
+            if repeated is not None and self.invariant(repeated[1]):
+                self.sizes[name] = linear(repeated[1])
+
+        self.safe = set()
+        self.scan(function.body, {})
+
+    def resize(self, node):
+        if isinstance(node, Name):
+            self.resized.add(node.id)
+
+    def stable(self, name):
+        """Check whether the length of the list name never changes.
+
+        Globals are left out, as the functions this one calls could resize them.
+        """
+
+        if name in self.resized:
+            return False
+
+        # Parameters are bound on entry, so any store to one rebinds it
+        stores = self.stores.get(name, 0)
+        return stores == (0 if name in self.parameters else 1)
+
+    def invariant(self, node):
+        """ Check that node has the same value wherever it is in the function. """
+
+        for child in ast.walk(node):
+            if isinstance(child, Call):
+                name = length_of(child)
+                if name is None or not self.stable(name):
+                    return False
+            elif isinstance(child, Name):
+                if child.id in self.stores:
+                    return False
+            elif not isinstance(child, INVARIANT_NODES):
+                return False
+
+        return True
+
+    def scan(self, statements, counters):
+        """Check the subscripts below statements.
+
+        counters maps the range() counters in scope to the lowest value each
+        can take and the linear() form of its stop.
+        """
+
+        pending = [(statement, counters) for statement in statements]
+        while pending:
+            node, counters = pending.pop()
+            if isinstance(node, (FunctionDef, ClassDef, Lambda)):
+                continue
+
+            if isinstance(node, Subscript):
+                self.check(node, counters)
+
+            inner = counters
+            if isinstance(node, For):
+                counter = self.range_counter(node, counters)
+                if counter is not None:
+                    inner = {**counters, node.target.id: counter}
+
+                pending.extend((statement, inner) for statement in node.body)
+                pending.extend(
+                    (child, counters)
+                    for child in (node.target, node.iter, *node.orelse)
+                )
+                continue
+
+            pending.extend((child, counters) for child in ast.iter_child_nodes(node))
+
+    def range_counter(self, node, counters):
+        """ Get the bounds of the counter of a range() loop, if usable. """
+
+        iterable = node.iter
+        if not (
+            isinstance(node.target, Name)
+            and isinstance(iterable, Call)
+            and isinstance(iterable.func, Name)
+            and iterable.func.id == "range"
+            and 1 <= len(iterable.args) <= 3
+            and not iterable.keywords
+        ):
+            return None
+
+        if assigns(node.body, node.target.id):
+            return None
+
+        args = iterable.args
+        if len(args) == 1:
+            lowest, stop = 0, args[0]
+        else:
+            start, stop = args[0], args[1]
+            lowest = integer_value(start)
+            if lowest is None:
+                if not self.non_negative(start, counters):
+                    return None
+                lowest = 0
+
+        if len(args) == 3 and not self.positive(args[2], counters):
+            return None
+
+        return lowest, linear(stop)
+
+    def non_negative(self, node, counters):
+        value = integer_value(node)
+        if value is not None:
+            return value >= 0
+
+        if isinstance(node, Name):
+            return node.id in counters and counters[node.id][0] >= 0
+
+        if length_of(node) is not None:
+            return True
+
+        if isinstance(node, BinOp) and isinstance(node.op, (Add, Mult)):
+            return self.non_negative(node.left, counters) and self.non_negative(
+                node.right, counters
+            )
+
+        return False
+
+    def positive(self, node, counters):
+        value = integer_value(node)
+        if value is not None:
+            return value > 0
+
+        return (
+            isinstance(node, Name)
+            and node.id in counters
+            and counters[node.id][0] > 0
+        )
+
+    def lengths(self, name):
+        """ Get the linear() forms the length of the list name is known by. """
+
+        lengths = {("len", name): 0}
+        if name in self.sizes:
+            base, shift = self.sizes[name]
+            lengths[base] = shift
+
+        return lengths
+
+    def check(self, node, counters):
+        value = node.value
+        if not (isinstance(value, Name) and self.stable(value.id)):
+            return
+
+        base, shift = linear(index_of(node))
+        lengths = self.lengths(value.id)
+
+        if base is None:
+            if 0 <= shift < lengths.get(None, 0):
+                self.safe.add(node)
+            return
+
+        kind, counter = base
+        if kind != "name" or counter not in counters:
+            return
+
+        # The counter runs from lowest up to, but not including, the stop
+        lowest, (stop_base, stop_shift) = counters[counter]
+        if lowest + shift < 0 or stop_base not in lengths:
+            return
+
+        if stop_shift + shift <= lengths[stop_base]:
+            self.safe.add(node)
+
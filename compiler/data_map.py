@@ -53,6 +53,33 @@ OPERATORS = {
     GtE: ">=",
 }
 
+# Binding strength of each operator in c++, lower numbers binding tighter
+PRECEDENCE = {
+    UAdd: 3,
+    USub: 3,
+    Not: 3,
+    Invert: 3,
+    Mult: 5,
+    Div: 5,
+    FloorDiv: 5,
+    Mod: 5,
+    Add: 6,
+    Sub: 6,
+    LShift: 7,
+    RShift: 7,
+    Lt: 9,
+    LtE: 9,
+    Gt: 9,
+    GtE: 9,
+    Eq: 10,
+    NotEq: 10,
+    BitAnd: 11,
+    BitXor: 12,
+    BitOr: 13,
+    And: 14,
+    Or: 15,
+}
+
 EXCEPTIONS = {
     "Exception": "std::exception",
     "IndexError": "std:out_of_range",
@@ -66,15 +93,47 @@ TYPES = {
     "float": "double",
     "List": "std::vector",
     "list": "std::vector",
+    "tuple": "std::tuple",
     "None": "void",
     "bool": "bool",
     **EXCEPTIONS,
 }
 
+# How each layout a list can be annotated with stores its elements, where that
+# differs from their type. std::vector<bool> packs its elements into bits, so
+# that each access goes through a proxy object that masks and shifts, and an
+# element declared with auto aliases the list. Bytes cost eight times the
+# memory but are read and written directly; packed bits only win once the list
+# outgrows the cache.
+LAYOUTS = {
+    "bytes": {"bool": "std::uint8_t"},
+    "packed": {},
+}
+
+DEFAULT_LAYOUT = "bytes"
+
+# Size and alignment of the types fields can have, in a 64 bit build against
+# libstdc++. Classes are measured as they are translated.
+POINTER_LAYOUT = (8, 8)
+
+TYPE_LAYOUTS = {
+    "bool": (1, 1),
+    "std::uint8_t": (1, 1),
+    "int": (4, 4),
+    "double": (8, 8),
+    "std::string": (32, 8),
+    "std::string_view": (16, 8),
+    "std::vector": (24, 8),
+}
+
 
 INCLUDES = {
     "std::string": "<string>",
     "std::vector": "<vector>",
+    "std::array": "<array>",
+    "std::tuple": "<tuple>",
+    "std::string_view": "<string_view>",
+    "std::uint8_t": "<cstdint>",
 }
 
 
@@ -100,6 +159,25 @@ def get_type(name):
     return cpp_type, INCLUDES.get(cpp_type)
 
 
+def list_type(element_type, layout=DEFAULT_LAYOUT):
+    """ Get the c++ type of a list of element_type stored in a layout. """
+
+    storage = LAYOUTS[layout].get(element_type, element_type)
+    return f"std::vector<{storage}>"
+
+
+def list_element_type(cpp_type):
+    """ Get the type of the elements of a list type, undoing their storage. """
+
+    storage = cpp_type[len("std::vector<") : -1]
+    for stored in LAYOUTS.values():
+        for element_type, storage_type in stored.items():
+            if storage == storage_type:
+                return element_type
+
+    return storage
+
+
 def get_operator(op_node):
 
     try:
@@ -115,4 +193,10 @@ def get_exception_type(name):
     try:
         return EXCEPTIONS[name]
     except KeyError:
-        raise UnknownTypeError(f"{name} not recognized as a c++ exception")
\ No newline at end of file
+        raise UnknownTypeError(f"{name} not recognized as a c++ exception")
+
+
+def get_precedence(op_node):
+    """ Get the c++ precedence of an operator node, see PRECEDENCE. """
+
+    return PRECEDENCE[type(op_node)]
@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+
+SPACES_PER_TAB = 4
+
+# Largest amount of generated code kept in memory before it is written out
+BUFFER_SIZE = 1 << 16
+
+
+class CodeEmitter:
+    """Buffered writer for generated c++.
+
+    Code is collected in a small in-memory buffer that is flushed to a
+    temporary spool file whenever it grows past buffer_size characters, so
+    the emitter's memory use is bounded regardless of the size of the output.
+    finish() writes a header, such as the #include block which is only known
+    once the whole module has been visited, to the sink ahead of the body.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.spool = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+
+        self.buffer = []
+        self.buffered = 0
+
+        self.indents = [""]
+
+        # Bytes of c++ produced and the largest chunk held in memory at once
+        self.bytes_written = 0
+        self.peak_memory = 0
+
+    def indentation(self, level):
+        """ Get the cached indentation string for an indent level. """
+
+        while level >= len(self.indents):
+            self.indents.append(" " * (SPACES_PER_TAB * len(self.indents)))
+
+        return self.indents[level]
+
+    def write(self, text, indent=0):
+        if indent:
+            text = self.indentation(indent) + text
+
+        self.buffer.append(text)
+        self.buffered += len(text)
+
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        chunk = "".join(self.buffer)
+        self.buffer.clear()
+        self.buffered = 0
+
+        size = len(chunk.encode())
+        self.bytes_written += size
+        self.peak_memory = max(self.peak_memory, size)
+
+        self.spool.write(chunk)
+
+    def finish(self, sink, header=""):
+        """ Write header followed by everything emitted so far to sink. """
+
+        self.flush()
+
+        if header:
+            sink.write(header)
+            self.bytes_written += len(header.encode())
+
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, sink)
+        self.spool.close()
+
+
+class StringEmitter:
+    """ Collects emitted code in memory, for rendering short expressions. """
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text, indent=0):
+        self.parts.append(text)
+
+    def getvalue(self):
+        return "".join(self.parts)
@@ -0,0 +1,592 @@
+import ast
+from ast import (
+    AnnAssign,
+    Assign,
+    Attribute,
+    AugAssign,
+    BinOp,
+    BoolOp,
+    Call,
+    ClassDef,
+    Compare,
+    Constant,
+    Del,
+    Div,
+    For,
+    FormattedValue,
+    FunctionDef,
+    JoinedStr,
+    Lambda,
+    List,
+    Load,
+    Name,
+    Not,
+    Slice,
+    Store,
+    Subscript,
+    Tuple,
+    UnaryOp,
+)
+
+from compiler import CompileError, list_element_type, list_type
+from compiler.analysis import repeated_list
+
+CONSTANT_TYPES = {
+    bool: "bool",
+    int: "int",
+    float: "double",
+    str: "std::string",
+}
+
+CONVERSIONS = {
+    "bool": "bool",
+    "int": "int",
+    "float": "double",
+    "str": "std::string",
+    "len": "int",
+}
+
+# Types too large to copy for every call
+LARGE_TYPES = ("std::string", "std::vector", "std::array", "std::tuple")
+
+# Methods that never modify the object they are called on
+READ_ONLY_METHODS = frozenset(
+    (
+        "count",
+        "endswith",
+        "find",
+        "index",
+        "isdigit",
+        "lower",
+        "split",
+        "startswith",
+        "strip",
+        "upper",
+    )
+)
+
+# Nested scopes, and the leaf nodes that only ever describe their parent
+SKIPPED_NODES = (
+    FunctionDef,
+    ClassDef,
+    Lambda,
+    ast.expr_context,
+    ast.operator,
+    ast.unaryop,
+    ast.boolop,
+    ast.cmpop,
+)
+
+
+def is_slots(statement):
+    """ Check whether a statement of a class body assigns its __slots__. """
+
+    return (
+        isinstance(statement, Assign)
+        and len(statement.targets) == 1
+        and isinstance(statement.targets[0], Name)
+        and statement.targets[0].id == "__slots__"
+    )
+
+
+def slot_names(node):
+    """ Get the names listed by the value of a __slots__ assignment. """
+
+    elements = node.elts if isinstance(node, (List, Tuple)) else [node]
+    if not all(
+        isinstance(element, Constant) and isinstance(element.value, str)
+        for element in elements
+    ):
+        raise CompileError("__slots__ must be a literal sequence of names")
+
+    return [element.value for element in elements]
+
+
+def class_fields(node):
+    """Get the name, annotation and default value of each field of a class.
+
+    The fields are those annotated in the class body, unless the class lists
+    them in __slots__. Slots not annotated in the body take the annotation of
+    the __init__ parameter of the same name, or None if there isn't one.
+    """
+
+    annotated = {}
+    slots = None
+    parameters = {}
+    for statement in node.body:
+        if isinstance(statement, AnnAssign) and isinstance(statement.target, Name):
+            annotated[statement.target.id] = statement
+        elif is_slots(statement):
+            slots = slot_names(statement.value)
+        elif isinstance(statement, FunctionDef) and statement.name == "__init__":
+            parameters = {arg.arg: arg.annotation for arg in statement.args.args}
+
+    if slots is None:
+        return [
+            (name, statement.annotation, statement.value)
+            for name, statement in annotated.items()
+        ]
+
+    fields = []
+    for name in slots:
+        statement = annotated.get(name)
+        if statement is None:
+            fields.append((name, parameters.get(name), None))
+        else:
+            fields.append((name, statement.annotation, statement.value))
+
+    return fields
+
+
+def function_nodes(function):
+    """Get the nodes of a function's body, without entering nested scopes.
+
+    Contexts and operators are left out, as nothing here looks at them alone.
+    """
+
+    nodes = []
+    pending = list(function.body)
+    while pending:
+        node = pending.pop()
+        nodes.append(node)
+
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, SKIPPED_NODES):
+                pending.append(child)
+
+    return nodes
+
+
+def root_name(node):
+    while isinstance(node, (Attribute, Subscript)):
+        node = node.value
+
+    return node.id if isinstance(node, Name) else None
+
+
+def element_type(container):
+    """ Get the type of the elements of a c++ container type, if known. """
+
+    if container is None:
+        return None
+
+    if container.startswith("std::vector<"):
+        return list_element_type(container)
+
+    if container.startswith("std::array<"):
+        return container[len("std::array<") : container.rindex(",")]
+
+    return None
+
+
+def loop_aliases(node):
+    """Get the (name, sequence) pairs of the names a for loop binds to elements.
+
+    The loop translates each name to a reference into the sequence, so
+    modifying one modifies the sequence. Indexes of enumerate() and range()
+    counters are copies, and left out.
+    """
+
+    iterable = node.iter
+    target = node.target
+
+    if isinstance(iterable, Call) and isinstance(iterable.func, Name):
+        function = iterable.func.id
+        targets = target.elts if isinstance(target, Tuple) else [target]
+        if function == "enumerate" and len(iterable.args) >= 1:
+            return list(zip(targets[1:], iterable.args[:1]))
+
+        if function == "zip":
+            return list(zip(targets, iterable.args))
+
+        if function == "range":
+            return []
+
+    return [(target, iterable)]
+
+
+def receiver_type(node, types):
+    """ Get the type of a name or an item of one, looked up in types. """
+
+    if isinstance(node, Name):
+        return types.get(node.id)
+
+    if isinstance(node, Subscript):
+        return element_type(receiver_type(node.value, types))
+
+    return None
+
+
+def mutated_names(nodes, types=None):
+    """Get the names that a function's nodes rebind or might modify in place.
+
+    Assigning to a name, to one of its items or attributes, and calling any
+    method all count as modification, except for methods known to be read
+    only on the builtin types. types maps names to their c++ types, where
+    known. Modifying a loop variable that refers to the elements of a
+    sequence also modifies that sequence.
+    """
+
+    types = dict(types or {})
+
+    # The sequence each loop variable refers into, and the nodes binding them
+    aliases = {}
+    bindings = set()
+    for node in nodes:
+        if isinstance(node, For):
+            for target, sequence in loop_aliases(node):
+                if isinstance(target, Name) and root_name(sequence):
+                    aliases[target.id] = sequence
+                    bindings.add(id(target))
+
+    # Inner loops can iterate over the variables of outer ones
+    for _ in range(len(aliases)):
+        for name, sequence in aliases.items():
+            if types.get(name) is None:
+                types[name] = element_type(receiver_type(sequence, types))
+
+    names = set()
+    for node in nodes:
+        if isinstance(node, Name) and isinstance(node.ctx, Store):
+            if id(node) not in bindings:
+                names.add(node.id)
+        elif isinstance(node, (Attribute, Subscript)) and isinstance(
+            node.ctx, (Store, Del)
+        ):
+            names.add(root_name(node))
+        elif isinstance(node, Call) and isinstance(node.func, Attribute):
+            receiver = node.func.value
+            cpp_type = receiver_type(receiver, types)
+            if not (
+                node.func.attr in READ_ONLY_METHODS
+                and cpp_type is not None
+                and cpp_type.startswith("std::")
+            ):
+                names.add(root_name(receiver))
+
+    # Modifying an element modifies the sequences it is in
+    pending = [name for name in names if name in aliases]
+    while pending:
+        sequence = root_name(aliases[pending.pop()])
+        if sequence not in names:
+            names.add(sequence)
+            if sequence in aliases:
+                pending.append(sequence)
+
+    names.discard(None)
+    return names
+
+
+def viewed_names(nodes):
+    """Get the names that a function only reads as a std::string_view can be.
+
+    That is compared, indexed, measured with len(), printed, formatted into an
+    f-string or appended to another string. Whether the names are strings is
+    left to the caller.
+    """
+
+    viewable = set()
+    for node in nodes:
+        if isinstance(node, Compare):
+            operands = [node.left, *node.comparators]
+        elif isinstance(node, FormattedValue):
+            operands = [node.value]
+        elif isinstance(node, Subscript) and isinstance(node.ctx, Load):
+            operands = [] if isinstance(node.slice, Slice) else [node.value]
+        elif isinstance(node, AugAssign) and isinstance(node.op, ast.Add):
+            operands = [node.value]
+        elif isinstance(node, Call) and isinstance(node.func, Name):
+            operands = node.args if node.func.id in ("len", "print") else []
+        else:
+            continue
+
+        viewable.update(id(operand) for operand in operands)
+
+    names = set()
+    others = set()
+    for node in nodes:
+        if isinstance(node, Name):
+            if isinstance(node.ctx, Load) and id(node) in viewable:
+                names.add(node.id)
+            else:
+                others.add(node.id)
+
+    return names - others
+
+
+def is_large(cpp_type, classes=()):
+    return cpp_type in classes or cpp_type.startswith(LARGE_TYPES)
+
+
+def merge(types):
+    """ Get the single c++ type that can hold every one of types, if any. """
+
+    if None in types or not types:
+        return None
+
+    if len(types) == 1:
+        return next(iter(types))
+
+    if types == {"int", "double"}:
+        return "double"
+
+    return None
+
+
+class ModuleTypes:
+    """The types of the definitions among a module's top level statements.
+
+    resolve(annotation) converts an annotation node into a c++ type. Classes
+    inherit the fields and methods of bases defined before them.
+    """
+
+    def __init__(self, statements, resolve):
+        self.functions = {}
+        self.classes = {}
+        self.methods = {}
+
+        self.resolve = resolve
+
+        for node in statements:
+            if isinstance(node, FunctionDef):
+                self.functions[node.name] = self.annotation_type(node.returns)
+            elif isinstance(node, ClassDef):
+                fields = {}
+                for base in node.bases:
+                    if isinstance(base, Name) and base.id in self.classes:
+                        fields.update(self.classes[base.id])
+                        self.methods.update(
+                            [
+                                ((node.name, method), method_type)
+                                for (owner, method), method_type in self.methods.items()
+                                if owner == base.id
+                            ]
+                        )
+
+                for name, annotation, _ in class_fields(node):
+                    fields[name] = self.annotation_type(annotation)
+                self.classes[node.name] = fields
+
+                for statement in node.body:
+                    if isinstance(statement, FunctionDef):
+                        self.methods[node.name, statement.name] = (
+                            self.annotation_type(statement.returns)
+                        )
+
+    def annotation_type(self, annotation):
+        """ Resolve an annotation, None if it is missing or unsupported. """
+
+        if annotation is None:
+            return None
+
+        try:
+            return self.resolve(annotation)
+        except CompileError:
+            return None
+
+
+class LocalTypes:
+    """Flow insensitive inference of the types of a function's variables.
+
+    nodes are those of the function's body, as given by function_nodes.
+
+    Every assignment to a variable contributes a candidate type; variables
+    whose candidates agree, or are a mix of int and float, get that type.
+    Everything else is left out, to be declared with auto.
+
+    Candidates that can't be typed yet are ignored at first, so that an
+    assignment like x = x // 2 doesn't stop x from ever getting a type. The
+    guesses are then checked against every assignment, and any that doesn't
+    hold is dropped before solving again.
+    """
+
+    def __init__(self, nodes, module, parameters, current_class=""):
+        self.module = module
+        self.current_class = current_class
+        self.parameters = dict(parameters)
+
+        self.nodes = [
+            node
+            for node in nodes
+            if isinstance(node, (Assign, AnnAssign, AugAssign, For))
+        ]
+
+        excluded = set()
+        while True:
+            self.solve(excluded)
+
+            conflicts = {
+                name
+                for name, cpp_types in self.candidates().items()
+                if name in self.types and merge(cpp_types) != self.types[name]
+            }
+            if not conflicts:
+                break
+
+            excluded |= conflicts
+
+    def candidates(self):
+        """ Get the types of the values assigned to each name. """
+
+        candidates = {}
+        for node in self.nodes:
+            for name, cpp_type in self.assignments(node):
+                candidates.setdefault(name, set()).add(cpp_type)
+
+        return candidates
+
+    def solve(self, excluded):
+        """ Iterate the types of the names not in excluded to a fixpoint. """
+
+        self.types = {}
+        self.env = dict(self.parameters)
+
+        for _ in range(len(self.nodes) + 1):
+            types = {}
+            for name, cpp_types in self.candidates().items():
+                cpp_type = merge(cpp_types - {None})
+                if cpp_type and name not in excluded:
+                    types[name] = cpp_type
+
+            if types == self.types:
+                break
+
+            self.types = types
+            self.env = {**types, **self.parameters}
+
+    def assignments(self, node):
+        """ Get the (name, type) pairs bound by an assignment or loop. """
+
+        if isinstance(node, Assign):
+            if len(node.targets) == 1 and isinstance(node.targets[0], Name):
+                yield node.targets[0].id, self.type_of(node.value)
+        elif isinstance(node, AnnAssign):
+            if isinstance(node.target, Name):
+                yield node.target.id, self.module.annotation_type(node.annotation)
+        elif isinstance(node, AugAssign):
+            # Until a name has a type from elsewhere, x += ... tells us nothing
+            if isinstance(node.target, Name) and node.target.id in self.env:
+                name = node.target.id
+                yield name, self.binary_type(
+                    node.op, self.env.get(name), self.type_of(node.value)
+                )
+        elif isinstance(node, For):
+            yield from self.loop_targets(node)
+
+    def loop_targets(self, node):
+        iterable = node.iter
+        target = node.target
+
+        targets = target.elts if isinstance(target, Tuple) else [target]
+        if not all(isinstance(name, Name) for name in targets):
+            return
+
+        types = []
+        if isinstance(iterable, Call) and isinstance(iterable.func, Name):
+            function = iterable.func.id
+            if function == "range":
+                types = ["int"]
+            elif function == "enumerate" and iterable.args:
+                types = ["int", self.element_type(iterable.args[0])]
+            elif function == "zip":
+                types = [self.element_type(arg) for arg in iterable.args]
+        else:
+            types = [self.element_type(iterable)]
+
+        if len(types) == len(targets):
+            for name, cpp_type in zip(targets, types):
+                yield name.id, cpp_type
+
+    def element_type(self, node):
+        return element_type(self.type_of(node))
+
+    def binary_type(self, op, left, right):
+        numeric = ("int", "double", "bool")
+        if left in numeric and right in numeric:
+            if isinstance(op, Div) or "double" in (left, right):
+                return "double"
+
+            return "int"
+
+        if left == right == "std::string" and isinstance(op, ast.Add):
+            return "std::string"
+
+        return None
+
+    def type_of(self, node):
+        """ Infer the c++ type of an expression, None when it's unknown. """
+
+        if isinstance(node, Constant):
+            return CONSTANT_TYPES.get(type(node.value))
+
+        if isinstance(node, Name):
+            return self.env.get(node.id)
+
+        if isinstance(node, List):
+            element_types = {self.type_of(element) for element in node.elts}
+            element_type = merge(element_types)
+            return list_type(element_type) if element_type else None
+
+        if isinstance(node, Tuple):
+            element_types = {self.type_of(element) for element in node.elts}
+            if len(element_types) != 1 or None in element_types:
+                return None
+
+            return f"std::array<{element_types.pop()}, {len(node.elts)}>"
+
+        if isinstance(node, BinOp):
+            repeated = repeated_list(node)
+            if repeated is not None:
+                element_type = self.type_of(repeated[0])
+                return list_type(element_type) if element_type else None
+
+            return self.binary_type(
+                node.op, self.type_of(node.left), self.type_of(node.right)
+            )
+
+        if isinstance(node, UnaryOp):
+            if isinstance(node.op, Not):
+                return "bool"
+
+            return self.type_of(node.operand)
+
+        if isinstance(node, JoinedStr):
+            return "std::string"
+
+        if isinstance(node, (Compare, BoolOp)):
+            return "bool"
+
+        if isinstance(node, Subscript):
+            return self.element_type(node.value)
+
+        if isinstance(node, Attribute):
+            owner = self.owner_type(node.value)
+            return self.module.classes.get(owner, {}).get(node.attr)
+
+        if isinstance(node, Call):
+            return self.call_type(node.func)
+
+        return None
+
+    def owner_type(self, node):
+        if isinstance(node, Name) and node.id == "self":
+            return self.current_class
+
+        return self.type_of(node)
+
+    def call_type(self, func):
+        if isinstance(func, Name):
+            name = func.id
+            if name in self.module.classes:
+                return name
+
+            if name in self.module.functions:
+                return self.module.functions[name]
+
+            return CONVERSIONS.get(name)
+
+        if isinstance(func, Attribute):
+            owner = self.owner_type(func.value)
+            return self.module.methods.get((owner, func.attr))
+
+        return None
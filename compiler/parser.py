@@ -1,59 +1,322 @@
 #! /usr/bin/env python3
 
 import ast
+import copy
+import io
+import logging
 import os
 import sys
-from ast import Attribute, Call, Constant, Expr, FunctionDef, If, Name, Subscript, List
-from collections import defaultdict
+import time
+import zlib
+from ast import (
+    AnnAssign,
+    Attribute,
+    Call,
+    ClassDef,
+    Constant,
+    Div,
+    Expr,
+    For,
+    FormattedValue,
+    FunctionDef,
+    If,
+    Import,
+    ImportFrom,
+    JoinedStr,
+    List,
+    Name,
+    Subscript,
+    Tuple,
+)
 
 from compiler import (
+    INCLUDES,
+    LAYOUTS,
+    POINTER_LAYOUT,
+    TYPE_LAYOUTS,
     TYPES,
     CompileError,
     UnknownTypeError,
     get_exception_type,
     get_operator,
+    get_precedence,
     get_type,
+    list_type,
+)
+from compiler.analysis import (
+    appended_lengths,
+    assigns,
+    counted_appends,
+    integer_value,
+    loop_appends,
+    loop_trips,
+    repeated_list,
+    simple_value,
+)
+from compiler.bounds import SafeSubscripts
+from compiler.emitter import CodeEmitter, StringEmitter
+from compiler.inference import (
+    CONSTANT_TYPES,
+    LocalTypes,
+    ModuleTypes,
+    class_fields,
+    function_nodes,
+    is_large,
+    is_slots,
+    merge,
+    mutated_names,
+    viewed_names,
+)
+from compiler.passes import PASSES, run_passes
+from compiler.runtime import OUTPUT_BUFFER_SIZE, SUPPORT
+from compiler.stream import top_level_statements
+
+logger = logging.getLogger(__name__)
+
+# Member access binds more tightly than any operator in PRECEDENCE
+MEMBER_PRECEDENCE = 2
+
+# Expressions that can initialize a field in any order, without side effects
+INITIALIZER_NODES = (
+    ast.BinOp,
+    ast.BoolOp,
+    ast.Compare,
+    ast.FormattedValue,
+    ast.JoinedStr,
+    ast.List,
+    ast.Tuple,
+    ast.UnaryOp,
+    Constant,
+    Name,
+    ast.expr_context,
+    ast.operator,
+    ast.unaryop,
+    ast.boolop,
+    ast.cmpop,
 )
-
-SPACES_PER_TAB = 4
 
 
 class FunctionTypeError(CompileError):
     """ Functions must have their return types annotated. """
 
 
-def translate_file(path):
-    converter = Converter(path)
+def translate_file(
+    path,
+    profile=None,
+    fast_io=False,
+    passes=tuple(PASSES),
+    stream=False,
+    import_root=None,
+    checked=False,
+    subclassed=None,
+):
+    """Translate the python file at path into c++ source.
+
+    If a TranslationProfile is given, the time spent in each visitor and on
+    each source line is recorded into it. With fast_io, main unties std::cout
+    from stdio and gives it a large buffer. passes names the optimisations
+    from compiler.passes to run over the tree first. With stream, the module
+    is parsed and translated one top level statement at a time. Imports are
+    resolved against the directory import_root, by default that of path.
+    With checked, every list subscript is bounds checked, rather than only
+    those that can't be proven to be in bounds. Classes whose names aren't in
+    the set subclassed are declared final; by default none are.
+    """
+
+    converter = Converter(
+        path,
+        profile=profile,
+        fast_io=fast_io,
+        passes=passes,
+        stream=stream,
+        import_root=import_root,
+        checked=checked,
+        subclassed=subclassed,
+    )
     converter.compile()
 
     return converter.report()
 
 
-def get_return_annotation(function_source):
-    header = function_source.split("\n")[0]
-    if ") -> " not in header:
+def translate_to_shards(
+    path,
+    outputs,
+    header,
+    include,
+    profile=None,
+    fast_io=False,
+    passes=tuple(PASSES),
+    stream=False,
+    import_root=None,
+    checked=False,
+    subclassed=None,
+):
+    """Translate the python file at path, splitting its functions between outputs.
+
+    header receives the module's includes, declarations and classes, and each
+    output includes it by the name include. Returns the converter, whose
+    shard_emitters record what was written to each output and whose imports
+    are the project modules the file depends on.
+    """
+
+    converter = Converter(
+        path,
+        profile=profile,
+        fast_io=fast_io,
+        passes=passes,
+        stream=stream,
+        shards=len(outputs),
+        import_root=import_root,
+        checked=checked,
+        subclassed=subclassed,
+    )
+    converter.compile()
+    converter.write_shards(outputs, header, include)
+
+    return converter
+
+
+def shard_index(node, count):
+    """Get which of count shards a top level statement goes in.
+
+    Functions are placed by a hash of their name, so that adding or removing
+    one never moves the others into different shards.
+    """
+
+    if isinstance(node, FunctionDef):
+        return zlib.crc32(node.name.encode()) % count
+
+    return 0
+
+
+def line_offsets(source):
+    """ Get the byte offset at which each line of source starts. """
+
+    offsets = [0]
+    for line in source.splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+
+    return offsets
+
+
+def string_literal(text):
+    """ Quote text as a c++ string literal. """
+
+    escaped = []
+    for char in text:
+        if char in '\\"':
+            escaped.append(f"\\{char}")
+        elif char == "\n":
+            escaped.append("\\n")
+        elif char == "\t":
+            escaped.append("\\t")
+        elif ord(char) < 32 or ord(char) == 127:
+            escaped.append(f"\\{ord(char):03o}")
+        else:
+            escaped.append(char)
+
+    return f'"{"".join(escaped)}"'
+
+
+def print_text(value):
+    """ Get the text python's print writes for a constant. """
+
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def expression_precedence(node):
+    """ Get how loosely the c++ emitted for an expression binds, 0 if atomic. """
+
+    if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.BoolOp)):
+        return get_precedence(node.op)
+
+    if isinstance(node, ast.Compare):
+        # Chained comparisons are emitted joined by &&
+        op = ast.And() if len(node.ops) > 1 else node.ops[0]
+        return get_precedence(op)
+
+    if isinstance(node, Constant) and type(node.value) in (int, float):
+        if node.value < 0:
+            return get_precedence(ast.USub())
+
+    return 0
+
+
+def signature(node):
+    """Strip a top level statement down to the parts ModuleTypes reads.
+
+    Returns None for statements other than function and class definitions.
+    """
+
+    if isinstance(node, FunctionDef):
+        node.body = []
+        return node
+
+    if isinstance(node, ClassDef):
+        node.body = [
+            signature(statement) if isinstance(statement, FunctionDef) else statement
+            for statement in node.body
+            if isinstance(statement, (AnnAssign, FunctionDef)) or is_slots(statement)
+        ]
+        for statement in node.body:
+            if isinstance(statement, AnnAssign):
+                statement.value = None
+
+        return node
+
+    return None
+
+
+def dotted_name(node):
+    """ Get the dotted name an attribute chain spells, None if it isn't one. """
+
+    parts = []
+    while isinstance(node, Attribute):
+        parts.append(node.attr)
+        node = node.value
+
+    if not isinstance(node, Name):
+        return None
+
+    parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+def get_return_annotation(node):
+    """ Get the return annotation of a function definition node. """
+
+    returns = node.returns
+    if returns is None:
         raise FunctionTypeError("Functions must have a return type specified!")
 
-    type_ = header.split(") -> ")[-1].strip(":")
+    return returns
 
-    return type_
+
+class TranslatorState:
+    """ Mutable flags consulted while emitting code. """
+
+    __slots__ = ("indent", "line_start", "line_no")
+
+    def __init__(self):
+        self.indent = 0
+        self.line_start = True
+        self.line_no = 0
 
 
 class CompileFlag:
-    def __init__(self, parser, name):
-        self.parser = parser
+    __slots__ = ("state", "name")
+
+    def __init__(self, state, name):
+        self.state = state
         self.name = name
 
     @property
     def value(self):
-        try:
-            return getattr(self.parser, self.name)
-        except AttributeError:
-            return 0
+        return getattr(self.state, self.name)
 
     @value.setter
     def value(self, new_value):
-        setattr(self.parser, self.name, new_value)
+        setattr(self.state, self.name, new_value)
 
     def __enter__(self):
         self.value += 1
@@ -64,45 +327,363 @@ class CompileFlag:
 
 
 class Converter(ast.NodeVisitor):
-    def __init__(self, file_path):
+    # Visitor method for each node class, filled in as node types are seen
+    dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.dispatch = {}
+
+    def __init__(
+        self,
+        file_path,
+        profile=None,
+        fast_io=False,
+        passes=tuple(PASSES),
+        stream=False,
+        shards=0,
+        import_root=None,
+        checked=False,
+        subclassed=None,
+    ):
         self.path = os.path.abspath(file_path)
-        self.line_no = 0
+        self.state = TranslatorState()
+        self.profile = profile
+        self.fast_io = fast_io
+        self.passes = passes
+        self.stream = stream
+        self.checked = checked
 
         self.objects = {}
         self.current_class = ""
-        self.code = []
+        self.emitter = CodeEmitter()
         self.includes = set()
 
+        # Project modules imported, mapped to how their headers are included
+        self.import_root = os.path.abspath(
+            import_root or os.path.dirname(self.path)
+        )
+        self.imports = {}
+
+        # Names bound to imported modules, and imported names bound to others
+        self.modules = set()
+        self.renamed = {}
+
+        # Signatures of the definitions of each imported module
+        self.imported = {}
+
+        # When sharding, top level functions are emitted into one of these and
+        # only the classes are left in self.emitter, to go in the header
+        self.shard_emitters = [CodeEmitter() for _ in range(shards)]
+
+        # Names of the runtime helpers from compiler.runtime the code calls
+        self.support = set()
+
+        # Top level classes and function signatures, for the module's header
+        self.structs = []
+        self.declarations = []
+
+        # Classes that other classes of the project derive from, None if unknown,
+        # the layouts of the structs emitted so far and the fields of the
+        # class being translated
+        self.subclassed = subclassed
+        self.struct_layouts = {}
+        self.fields = []
+
         self.delcared = set()
 
-        self.flags = defaultdict(bool)
+        # Count of variables the translator introduced into the function being
+        # translated, to keep their names unique
+        self.hidden = 0
 
-        with open(self.path, "r") as source:
-            self.source = source.read()
-            self.tree = ast.parse(
-                self.source,
-                filename=self.path,
-            )
+        # Inferred types of the variables of the function being translated,
+        # the parameters it may modify and those it only reads as a view could
+        self.inference = None
+        self.local_types = {}
+        self.mutated = set()
+        self.viewed = set()
 
-        def set_attribute(self, name, value):
-            if name in self.__dict__:
-                super().__setattr__(name, value)
-            else:
-                self.flags[name] = value
+        # Subscripts of the function being translated that need no bounds check
+        self.safe_subscripts = set()
+
+        # Streamed modules are read by compile(), a statement at a time
+        self.tree = None
+        if not stream:
+            with open(self.path, "rb") as source:
+                self.tree = self.parse(source.read())
+
+    def parse(self, source, first_line=1):
+        """Parse the utf-8 source of the part of the file from first_line on.
+
+        Line numbers in the tree count from the start of source, and the source
+        replaces that of any earlier part as the one segment() cuts from.
+        """
+
+        try:
+            tree = ast.parse(source, filename=self.path)
+        except SyntaxError as error:
+            if error.lineno is not None:
+                error.lineno += first_line - 1
+            if error.end_lineno is not None:
+                error.end_lineno += first_line - 1
+            raise
+
+        # Line numbers of the last part no longer apply
+        self.state.line_no = 0
+
+        # ast column offsets count utf-8 bytes, so segments are cut from bytes
+        self.line_base = first_line - 1
+        self.source_bytes = source
+        self.line_offsets = line_offsets(source)
 
-        self.__setattr__ = set_attribute
+        return tree
 
     def compile(self):
+        if self.stream:
+            self.compile_stream()
+            return
+
+        self.tree = run_passes(self.tree, self.passes, self.profile, self.path)
+
+        statements = [
+            definition
+            for node in self.tree.body
+            if isinstance(node, (Import, ImportFrom))
+            for definition in self.add_import(node)
+        ]
+        statements.extend(self.tree.body)
+
+        self.classes = {
+            node.name for node in statements if isinstance(node, ast.ClassDef)
+        }
+        self.module_types = ModuleTypes(statements, self.resolve_annotation)
+
         self.visit(self.tree)
 
-    def __getattr__(self, name):
-        if name in dir(self):
-            return super().__getattribute__(name)
+    def compile_stream(self):
+        """Translate the module a top level statement at a time.
+
+        A first read of the file splits it into statements and collects the
+        signatures of its definitions and imports, which earlier ones may
+        refer to. The second parses, translates and frees each statement in
+        turn.
+        """
+
+        spans = []
+        signatures = []
+        for first_line, offset, source in top_level_statements(self.path):
+            spans.append((first_line, offset, len(source)))
+
+            for node in self.parse(source, first_line).body:
+                if isinstance(node, (Import, ImportFrom)):
+                    signatures.extend(self.add_import(node))
+
+                node = signature(node)
+                if node is not None:
+                    signatures.append(node)
+
+        # The signatures' source is gone by now, see segment()
+        self.source_bytes = None
+
+        self.classes = {node.name for node in signatures if isinstance(node, ClassDef)}
+        self.module_types = ModuleTypes(signatures, self.resolve_annotation)
+        del signatures
+
+        with open(self.path, "rb") as source:
+            for first_line, offset, size in spans:
+                source.seek(offset)
+                module = self.parse(source.read(size), first_line)
+
+                module = run_passes(module, self.passes, self.profile, self.path)
+                self.visit(module)
+
+    def module_path(self, name, level=0):
+        """Find the python file of a project module, None if it isn't one.
+
+        Absolute imports are looked up under import_root, and relative ones
+        from the directory of this module.
+        """
+
+        directory = self.import_root
+        if level:
+            directory = os.path.dirname(self.path)
+            for _ in range(level - 1):
+                directory = os.path.dirname(directory)
+
+        base = os.path.join(directory, *name.split(".")) if name else directory
+        for path in (f"{base}.py", os.path.join(base, "__init__.py")):
+            if os.path.isfile(path):
+                return path
+
+        return None
+
+    def import_module(self, path):
+        """ Include the header of the module at path, getting its signatures. """
 
-        if name.startswith("visit"):
-            return lambda node: self.generic_visit(node)
+        header = f"{os.path.splitext(path)[0]}.hpp"
+        self.imports[path] = os.path.relpath(header, os.path.dirname(self.path))
 
-        return self.flags[name]
+        signatures = self.imported.get(path)
+        if signatures is None:
+            with open(path, "rb") as source:
+                tree = ast.parse(source.read(), filename=path)
+
+            signatures = self.imported[path] = [
+                node for node in map(signature, tree.body) if node is not None
+            ]
+
+        return signatures
+
+    def add_import(self, node):
+        """Record the project modules and names an import statement binds.
+
+        Returns the signatures of the definitions it makes available. Imports
+        of anything other than project modules are ignored.
+        """
+
+        definitions = []
+        if isinstance(node, Import):
+            for alias in node.names:
+                path = self.module_path(alias.name)
+                if path is not None:
+                    definitions.extend(self.import_module(path))
+                    self.modules.add(alias.asname or alias.name)
+
+            return definitions
+
+        module = node.module or ""
+        for alias in node.names:
+            name = alias.asname or alias.name
+
+            # from package import module binds the module itself
+            path = self.module_path(f"{module}.{alias.name}".lstrip("."), node.level)
+            if path is not None:
+                definitions.extend(self.import_module(path))
+                self.modules.add(name)
+                continue
+
+            path = self.module_path(module, node.level)
+            if path is None:
+                continue
+
+            for definition in self.import_module(path):
+                if alias.name not in ("*", definition.name):
+                    continue
+
+                if name != alias.name:
+                    self.renamed[name] = alias.name
+                    if isinstance(definition, FunctionDef):
+                        definition = copy.copy(definition)
+                        definition.name = name
+
+                definitions.append(definition)
+
+        return definitions
+
+    @classmethod
+    def visitor_for(cls, node_class):
+        """ Resolve, once per node class, the method that visits it. """
+
+        try:
+            return cls.dispatch[node_class]
+        except KeyError:
+            method = getattr(cls, f"visit_{node_class.__name__}", cls.generic_visit)
+            cls.dispatch[node_class] = method
+            return method
+
+    def annotation_type(self, annotation):
+        """ Get the c++ type named by a type annotation. """
+
+        if isinstance(annotation, Name):
+            name = self.renamed.get(annotation.id, annotation.id)
+            if name in self.classes:
+                return name
+
+            return self.get_type(name)
+
+        if isinstance(annotation, Attribute):
+            if dotted_name(annotation.value) in self.modules:
+                if annotation.attr in self.classes:
+                    return annotation.attr
+
+        if isinstance(annotation, Constant):
+            return self.get_type(str(annotation.value))
+
+        if isinstance(annotation, Subscript) and isinstance(annotation.value, Name):
+            element = annotation.slice
+            if isinstance(element, ast.Index):
+                element = element.value
+
+            if annotation.value.id == "Annotated" and isinstance(element, Tuple):
+                return self.annotated_type(*element.elts)
+
+            container = self.get_type(annotation.value.id)
+            if container == "std::vector":
+                return self.declare_type(list_type(self.annotation_type(element)))
+
+        raise UnknownTypeError(f"No conversion for {self.segment(annotation)} is known")
+
+    def annotated_type(self, annotation, *metadata):
+        """Get the c++ type of `Annotated[annotation, *metadata]`.
+
+        A string naming one of LAYOUTS among the metadata picks how a list
+        stores its elements, such as "packed" to keep std::vector<bool>.
+        """
+
+        layouts = [
+            item.value
+            for item in metadata
+            if isinstance(item, Constant) and item.value in LAYOUTS
+        ]
+        if not layouts:
+            return self.annotation_type(annotation)
+
+        if not (
+            isinstance(annotation, Subscript)
+            and isinstance(annotation.value, Name)
+            and self.get_type(annotation.value.id) == "std::vector"
+        ):
+            raise UnknownTypeError(f"Only lists can have the layout {layouts[0]}")
+
+        element = annotation.slice
+        if isinstance(element, ast.Index):
+            element = element.value
+
+        element_type = self.annotation_type(element)
+        return self.declare_type(list_type(element_type, layouts[0]))
+
+    def resolve_annotation(self, annotation):
+        """ Get the c++ type of an annotation without including its headers. """
+
+        includes = set(self.includes)
+        try:
+            return self.annotation_type(annotation)
+        finally:
+            self.includes = includes
+
+    def declare_type(self, cpp_type):
+        """ Add the includes needed to declare a variable of cpp_type. """
+
+        for name, include in INCLUDES.items():
+            if name in cpp_type:
+                self.includes.add(include)
+
+        return cpp_type
+
+    def segment(self, node):
+        """Get the source text of node without re-reading the file.
+
+        Nodes whose source is no longer held, which happens when streaming,
+        are unparsed instead.
+        """
+
+        if self.source_bytes is None:
+            return ast.unparse(node)
+
+        start = self.line_offsets[node.lineno - 1] + node.col_offset
+        end = self.line_offsets[node.end_lineno - 1] + node.end_col_offset
+
+        return self.source_bytes[start:end].decode()
 
     def get_type(self, type_):
         cpp_type, include = get_type(type_)
@@ -112,40 +693,180 @@ class Converter(ast.NodeVisitor):
 
         return cpp_type
 
+    def source_line(self, line_no):
+        """ Get the line of the file that a line of the parsed part is, 0 if none. """
+
+        return self.line_base + line_no if line_no else 0
+
     def file_link(self, line_no):
-        return f'<File "{self.path}", line {line_no}>'
+        return f'<File "{self.path}", line {self.source_line(line_no)}>'
 
     def end_line(self, text=";"):
         self += f"{text}\n"
-        self.line_start = True
+        self.state.line_start = True
+
+    def use_support(self, name):
+        """ Get the name of a runtime helper, emitting it with the module. """
+
+        _, includes = SUPPORT[name]
+        self.includes.update(includes)
+        self.support.add(name)
+
+        return name
+
+    def print_keyword(self, keywords, name, default):
+        value = keywords.pop(name, None)
+        if value is None:
+            return default
+
+        if isinstance(value, Constant) and value.value is None:
+            return default
+
+        if not (isinstance(value, Constant) and isinstance(value.value, str)):
+            raise CompileError(f"print() {name} must be a constant string")
+
+        return value.value
+
+    def print_argument(self, arg):
+        """ Get c++ that streams arg the way print formats it. """
+
+        logger.debug("Print conversion visiting: %s", arg)
+
+        source = self.render(arg)
+        if not isinstance(arg, (Name, Constant, Subscript)):
+            source = f"({source})"
+
+        cpp_type = self.inference.type_of(arg) if self.inference else None
+        if cpp_type == "bool":
+            return f'({source} ? "True" : "False")'
+
+        if cpp_type == "double":
+            return f"{self.use_support('format_float')}({source})"
+
+        return source
 
     def convert_print(self, node):
-        """ Handle print function. """
+        """Handle print function.
+
+        Arguments are separated and terminated as python does. Constants are
+        formatted at translation time and joined with their neighbours, so
+        print("a", 1) streams the single literal "a 1\\n".
+        """
 
         self.includes.add("<iostream>")
 
-        self += "std::cout"
-        for arg in node.args:
-            self += " << "
-            print(f"Print conversion visiting: {arg}")
+        keywords = {keyword.arg: keyword.value for keyword in node.keywords}
+        sep = self.print_keyword(keywords, "sep", " ")
+        end = self.print_keyword(keywords, "end", "\n")
+        if keywords:
+            raise CompileError(f"print() does not support {', '.join(keywords)}")
+
+        # Alternating runs of literal text and streamed expressions
+        pieces = [""]
+        for i, arg in enumerate(node.args):
+            if i:
+                pieces[-1] += sep
+
+            if isinstance(arg, Constant):
+                pieces[-1] += print_text(arg.value)
+            elif isinstance(arg, JoinedStr):
+                # The parts of an f-string are streamed without joining them
+                for part in self.formatted_values(arg):
+                    if isinstance(part, Constant) and isinstance(part.value, str):
+                        pieces[-1] += print_text(part.value)
+                    else:
+                        pieces.extend((self.print_argument(part), ""))
+            else:
+                pieces.extend((self.print_argument(arg), ""))
 
-            if isinstance(arg, (Name, Constant, Subscript)):
-                self.visit(arg)
+        pieces[-1] += end
+
+        self += "std::cout"
+        for i, piece in enumerate(pieces):
+            if i % 2:
+                self += f" << {piece}"
+            elif piece:
+                self += f" << {string_literal(piece)}"
+
+    def formatted_values(self, node):
+        """ Get the literal text and values that an f-string is made of. """
+
+        for value in node.values:
+            if not isinstance(value, FormattedValue):
+                yield value
+                continue
+
+            if value.conversion not in (-1, ord("s")):
+                raise CompileError("f-strings only support the !s conversion")
+
+            if value.format_spec is not None:
+                raise CompileError("f-string format specifications are unsupported")
+
+            yield value.value
+
+    def visit_JoinedStr(self, node):
+        """ Handle f-strings, building each with a single allocation. """
+
+        self.join_strings(list(self.formatted_values(node)))
+
+    def join_strings(self, pieces):
+        """Emit a call joining pieces of text into one string.
+
+        Strings and literals are joined as they are, other values converted
+        the way str() does.
+        """
+
+        arguments = []
+        for piece in pieces:
+            cpp_type = self.inference.type_of(piece) if self.inference else None
+            if isinstance(piece, Constant) and isinstance(piece.value, str):
+                arguments.append(string_literal(piece.value))
+            elif cpp_type == "std::string":
+                arguments.append(self.render(piece))
+            elif cpp_type == "bool":
+                # Elements of a list[bool] may be stored as bytes
+                arguments.append(f"to_text(static_cast<bool>({self.render(piece)}))")
             else:
-                self += "("
-                self.visit(arg)
-                self += ")"
+                arguments.append(f"to_text({self.render(piece)})")
+
+        # to_text formats doubles with the float helper, so it goes first
+        self.use_support("format_float")
+        self += f"{self.use_support('join_strings')}({', '.join(arguments)})"
+
+    def concatenated(self, node):
+        """ Get the strings that a chain of + joins, [] if node isn't one. """
+
+        pieces = []
+        while (
+            isinstance(node, ast.BinOp)
+            and isinstance(node.op, ast.Add)
+            and self.inference.type_of(node) == "std::string"
+        ):
+            pieces.append(node.right)
+            node = node.left
+
+        if pieces:
+            pieces.append(node)
 
-        self += r' << "\n"'
+        return pieces[::-1]
 
     def visit(self, node):
-        if hasattr(node, "lineno"):
-            self.line_no = node.lineno
+        state = self.state
+        node_class = type(node)
+
+        line_no = getattr(node, "lineno", None)
+        if line_no is None:
+            line_no = state.line_no
+        else:
+            state.line_no = line_no
+
+        if self.profile is not None:
+            start = time.perf_counter()
 
         try:
-            super().visit(node)
+            self.visitor_for(node_class)(self, node)
         except CompileError as error:
-            file_link = self.file_link(self.line_no)
+            file_link = self.file_link(state.line_no)
 
             if file_link not in str(error):
                 raise type(error)(
@@ -153,15 +874,33 @@ class Converter(ast.NodeVisitor):
                 ) from error
 
             raise
+        finally:
+            if self.profile is not None:
+                self.profile.record(
+                    f"visit_{node_class.__name__}",
+                    f"{self.path}:{self.source_line(line_no)}",
+                    time.perf_counter() - start,
+                )
+
+    def visit_Module(self, node):
+        emitter = self.emitter
+        shards = self.shard_emitters
+
+        for statement in node.body:
+            if shards and not isinstance(statement, ClassDef):
+                self.emitter = shards[shard_index(statement, len(shards))]
+
+            self.visit(statement)
+            self.emitter = emitter
 
     def visit_Constant(self, node):
         """ Handle constants specified in the source. """
 
         value = node.value
-        print(f"Handling constant: {value}")
+        logger.debug("Handling constant: %s", value)
 
         if isinstance(value, str):
-            self += f'"{value}"'
+            self += string_literal(value)
         elif isinstance(value, bool):
             self += str(value).lower()
         else:
@@ -169,7 +908,7 @@ class Converter(ast.NodeVisitor):
 
     def handle_initialization_list(self, elements):
         self.end_line("{")
-        with CompileFlag(self, "indent"):
+        with CompileFlag(self.state, "indent"):
             for i, element in enumerate(elements):
                 self.visit(element)
                 if i + 1 < len(elements):
@@ -184,30 +923,76 @@ class Converter(ast.NodeVisitor):
 
         elements = node.elts
 
-        container_type = self.get_type("list")
-        element_type = self.get_type(type(elements[0].value).__name__)
+        if self.inference is not None:
+            element_types = {self.inference.type_of(element) for element in elements}
+        else:
+            element_types = {
+                CONSTANT_TYPES.get(type(getattr(element, "value", None)))
+                for element in elements
+            }
+
+        element_type = merge(element_types)
+        if element_type is None:
+            raise CompileError("Unknown element type of list, annotate its variable")
 
-        self += f"new {container_type}<{element_type}> "
+        self += f"{self.declare_type(list_type(element_type))} "
         self.handle_initialization_list(elements)
 
+    def tuple_type(self, node):
+        """Get the c++ type of a tuple literal.
+
+        Tuples whose elements all have the same type become a std::array,
+        as inference expects, other tuples a std::tuple of their element
+        types. When the element types aren't known the template arguments
+        are left for the c++ compiler to deduce.
+        """
+
+        element_types = []
+        for element in node.elts:
+            if self.inference is not None:
+                element_type = self.inference.type_of(element)
+            else:
+                element_type = CONSTANT_TYPES.get(type(getattr(element, "value", None)))
+
+            if element_type is None:
+                tuple_type = self.get_type("tuple")
+                return tuple_type, tuple_type
+
+            element_types.append(self.declare_type(element_type))
+
+        if len(set(element_types)) == 1:
+            self.includes.add(INCLUDES["std::array"])
+            return "std::array", f"std::array<{element_types[0]}, {len(element_types)}>"
+
+        tuple_type = self.get_type("tuple")
+        return tuple_type, f"{tuple_type}<{', '.join(element_types)}>"
+
     def visit_Tuple(self, node):
-        elements = node.elts
-        element_type = self.get_type(type(elements[0].value).__name__)
-        self += f"new {element_type}[{len(elements)}] "
-        self.handle_initialization_list(elements)
+        """ Handle tuple literals as fixed size values. """
+
+        _, cpp_type = self.tuple_type(node)
+
+        self += f"{cpp_type} "
+        self.handle_initialization_list(node.elts)
 
     def visit_Name(self, node):
         """ Handle variable names in the source. """
 
         name = node.id
-        print(f"Handling variable: {name}")
+        logger.debug("Handling variable: %s", name)
+
+        self += self.renamed.get(name, name)
 
-        self += name
+    def visit_Import(self, node):
+        self.add_import(node)
+
+    def visit_ImportFrom(self, node):
+        self.add_import(node)
 
     def visit_Expr(self, node):
         """ Handle expressions. """
 
-        print(f"Handling Expr: {node}")
+        logger.debug("Handling Expr: %s", node)
         self.generic_visit(node)
         self.end_line()
 
@@ -223,16 +1008,27 @@ class Converter(ast.NodeVisitor):
 
         target = node.targets[0]
         value = node.value
-        print(f"Handling assign: {target} = {value}")
+        logger.debug("Handling assign: %s = %s", target, value)
 
-        print(type(target))
+        logger.debug("Target type: %s", type(target))
         # Parse Attribute/Name before assignment operator
         if isinstance(target, Name):
             if target.id not in self.delcared:
-                self += "auto "
+                cpp_type = self.local_types.get(target.id)
+                if cpp_type is None:
+                    self += "auto "
+                else:
+                    self += f"{self.declare_type(cpp_type)} "
+
                 self.delcared.add(target.id)
                 if isinstance(value, List):
                     self.objects[target.id] = self.get_type(type(value).__name__)
+                elif isinstance(value, Tuple):
+                    self.objects[target.id], _ = self.tuple_type(value)
+                elif repeated_list(value) is not None or (
+                    cpp_type is not None and cpp_type.startswith("std::vector")
+                ):
+                    self.objects[target.id] = "std::vector"
             self.visit_Name(target)
         else:
             self.visit(target)
@@ -244,13 +1040,32 @@ class Converter(ast.NodeVisitor):
         annotation = node.annotation
         value = node.value
 
-        cpp_type = self.get_type(annotation.id)
+        cpp_type = self.annotation_type(annotation)
 
         self += f"{cpp_type} "
 
+        if isinstance(target, Name):
+            self.delcared.add(target.id)
+            if cpp_type.startswith("std::vector"):
+                self.objects[target.id] = "std::vector"
+
         self.visit(target)
 
-        if value:
+        # Lists are built in place, as the annotation may choose a layout for
+        # them other than the one their literal would get
+        repeated = repeated_list(value)
+        if cpp_type.startswith("std::vector") and repeated is not None:
+            element, count = repeated
+            self += "("
+            self.visit(count)
+            self += ", "
+            self.visit(element)
+            self.end_line(");")
+        elif cpp_type.startswith("std::vector") and isinstance(value, List):
+            self += " "
+            self.handle_initialization_list(value.elts)
+            self.end_line()
+        elif value:
             self.assign(value)
         else:
             self.end_line()
@@ -265,7 +1080,7 @@ class Converter(ast.NodeVisitor):
 
         operator = get_operator(op)
 
-        print(f"Handling augmented assign: {operator}")
+        logger.debug("Handling augmented assign: %s", operator)
 
         self += f" {operator}= "
 
@@ -276,40 +1091,57 @@ class Converter(ast.NodeVisitor):
         value = node.value
         attr = node.attr
 
-        accessor = "."
-
-        if isinstance(value, Name):
-            name = value.id
+        # Everything is translated into one namespace, so module.name is name
+        if dotted_name(value) in self.modules:
+            self += attr
+            return
 
         # TODO: Handle more generically
         if attr == "append":
-            accessor = "->"
             attr = "push_back"
 
-        print(f"Processing attribute: {name}.{attr}")
+        logger.debug("Processing attribute: %s", attr)
 
-        if name == "self":
-            self += "this"
+        if isinstance(value, Name) and value.id == "self":
+            self += "this->"
         else:
-            self += f"{name}"
-
-        self += accessor
+            self.visit_operand(value, MEMBER_PRECEDENCE)
+            self += "."
 
-        self += f"{attr}"
+        self += attr
 
     def visit_Subscript(self, node):
         value = node.value
         slice_ = node.slice
 
-        self.visit(value)
+        # Python < 3.9 wraps the index in an ast.Index node
+        index = slice_.value if isinstance(slice_, ast.Index) else slice_
 
         # TODO: Handle more generically
-        if self.objects.get(value.id) == "std::vector":
-            self += f"->at("
-            self.visit(slice_.value)
+        container = self.objects.get(getattr(value, "id", None))
+
+        if container == "std::tuple":
+            if not (isinstance(index, Constant) and type(index.value) is int):
+                raise CompileError("Tuples of mixed types need constant indexes")
+
+            self += f"std::get<{index.value}>("
+            self.visit(value)
+            self += ")"
+            return
+
+        self.visit(value)
+
+        # Bounds are only left unchecked where they are proven to hold
+        if container in ("std::vector", "std::array") and (
+            node not in self.safe_subscripts
+        ):
+            self += ".at("
+            self.visit(index)
             self += ")"
         else:
-            self.visit(slice_)
+            self += "["
+            self.visit(index)
+            self += "]"
 
     def visit_Index(self, node):
         self += "["
@@ -323,18 +1155,24 @@ class Converter(ast.NodeVisitor):
         args = node.args
         keywords = node.keywords
 
+        if isinstance(func, Name) and func.id == "print":
+            self.convert_print(node)
+            return
+
         if keywords:
             raise CompileError("C++ does not support named arguments")
 
-        if isinstance(func, Name):
-            if func.id == "print":
-                self.convert_print(node)
-                return
+        if isinstance(func, Name) and func.id == "len" and len(args) == 1:
+            self += "static_cast<int>("
+            self.visit_operand(args[0], MEMBER_PRECEDENCE)
+            self += ".size())"
+            return
 
+        if isinstance(func, Name):
             if func.id in TYPES:
                 func.id = self.get_type(func.id)
 
-        print(f"Handling function call: {func}")
+        logger.debug("Handling function call: %s", func)
 
         self.visit(func)
         self += "("
@@ -349,18 +1187,14 @@ class Converter(ast.NodeVisitor):
     def visit_Return(self, node):
         """ Handle return statements. """
 
-        print(f"Handling return: {type(node.value)}")
+        logger.debug("Handling return: %s", type(node.value))
         self += "return "
         self.visit(node.value)
         self.end_line()
 
     def handle_body(self, body):
-        with CompileFlag(self, "indent"):
+        with CompileFlag(self.state, "indent"):
             for node in body:
-                if isinstance(node, FunctionDef):
-                    if node.name == "__init__":
-                        node.name = name
-
                 self.visit(node)
 
     def visit_FunctionDef(self, node):
@@ -369,83 +1203,285 @@ class Converter(ast.NodeVisitor):
         name = node.name
         args = node.args
         body = node.body
-        print(f"Handling function definition: {name} {args}")
+        logger.debug("Handling function definition: %s %s", name, args)
+
+        constructor = bool(self.current_class) and name == "__init__"
+        if constructor:
+            name = self.current_class
+            return_type = ""
+        else:
+            return_type = self.annotation_type(get_return_annotation(node))
+
+        saved = (
+            self.inference,
+            self.local_types,
+            self.mutated,
+            self.viewed,
+            self.delcared,
+            self.safe_subscripts,
+            self.objects,
+            self.hidden,
+        )
+        # Containers the function defines are local to it, globals aren't
+        self.objects = dict(self.objects)
+
+        # Hidden names are numbered within each function, so that editing one
+        # function leaves the code of the others, and their shards, unchanged
+        self.hidden = 0
+
+        nodes = function_nodes(node)
+        annotated = {
+            arg.arg: self.annotation_type(arg.annotation)
+            for arg in args.args
+            if arg.annotation is not None
+        }
+        self.mutated = mutated_names(nodes, annotated)
+        self.viewed = viewed_names(nodes)
+
+        parameter_types = {}
+        # Constructors have no return type
+        declarator = f"{return_type} {name}" if return_type else name
+        signature = f"{declarator} ({self.parameters(args, parameter_types)})"
+        if not self.current_class:
+            self.declarations.append(signature)
+
+        self.inference = LocalTypes(
+            nodes, self.module_types, parameter_types, self.current_class
+        )
+        self.local_types = self.inference.types
+        self.delcared = set(parameter_types)
+        self.safe_subscripts = set() if self.checked else SafeSubscripts(node).safe
+
+        if constructor:
+            initializers, body = self.member_initializers(body)
+            if initializers:
+                signature = f"{signature} : {', '.join(initializers)}"
+
+        self.end_line(f"{signature} {{")
+        if self.fast_io and name == "main" and not self.current_class:
+            self.fast_io_main(body)
+        else:
+            self.handle_body(body)
+        self.end_line("}")
 
-        function_definition = ast.get_source_segment(open(self.path).read(), node)
+        (
+            self.inference,
+            self.local_types,
+            self.mutated,
+            self.viewed,
+            self.delcared,
+            self.safe_subscripts,
+            self.objects,
+            self.hidden,
+        ) = saved
+
+    def member_initializers(self, body):
+        """Split the member initializer list of a constructor off its body.
+
+        The leading `self.field = value` statements become initializers, so
+        that their fields are constructed once with their values rather than
+        default constructed and then assigned. C++ initializes fields in the
+        order they are declared, so only values that read nothing but the
+        parameters and constants are moved. Returns the initializers, in the
+        order of the fields, and the rest of the body.
+        """
+
+        values = {}
+        for count, statement in enumerate(body):
+            if not (
+                isinstance(statement, ast.Assign)
+                and len(statement.targets) == 1
+                and isinstance(statement.targets[0], Attribute)
+                and isinstance(statement.targets[0].value, Name)
+                and statement.targets[0].value.id == "self"
+            ):
+                break
+
+            field = statement.targets[0].attr
+            value = statement.value
+            if field not in self.fields or field in values:
+                break
+
+            if not all(
+                isinstance(child, INITIALIZER_NODES)
+                and not (isinstance(child, Name) and child.id == "self")
+                for child in ast.walk(value)
+            ):
+                break
+
+            values[field] = self.render(value)
+        else:
+            count = len(body)
 
-        try:
-            return_type = self.get_type(get_return_annotation(function_definition))
-        except FunctionTypeError:
-            if node.name == self.current_class:
-                return_type = ""
-            else:
-                raise
+        initializers = [
+            f"{field}({values[field]})" for field in self.fields if field in values
+        ]
+        return initializers, body[count:]
 
-        self += f"{return_type} {name} ("
+    def fast_io_main(self, body):
+        """Emit the body of main with buffered output that isn't synced to stdio.
 
-        self.visit(args)
+        Uncaught exceptions are rethrown once std::cout is flushed, so that the
+        output printed before them isn't lost when the program terminates.
+        """
 
-        self.end_line(") {")
-        self.handle_body(body)
-        self.end_line("}")
+        self.includes.add("<iostream>")
+
+        buffer = self.hidden_name("output_buffer")
+        with CompileFlag(self.state, "indent"):
+            self.end_line("std::ios_base::sync_with_stdio(false);")
+            self.end_line(f"static char {buffer}[{OUTPUT_BUFFER_SIZE}];")
+            self.end_line(f"std::cout.rdbuf()->pubsetbuf({buffer}, sizeof {buffer});")
+            self.end_line("try {")
+
+        with CompileFlag(self.state, "indent"):
+            self.handle_body(body)
+
+        with CompileFlag(self.state, "indent"):
+            self.end_line("} catch (...) {")
+            with CompileFlag(self.state, "indent"):
+                self.end_line("std::cout.flush();")
+                self.end_line("throw;")
+            self.end_line("}")
+
+    def parameters(self, node, types=None):
+        """Get the c++ parameter list of a function's arguments.
+
+        The type of each parameter is recorded in types, if given.
+        """
 
-    def visit_arguments(self, node):
         args = node.args
-        print(f"Handling function args: {args}")
-        if not args:
-            return
+        logger.debug("Handling function args: %s", args)
 
-        for i, arg in enumerate(args):
-            skipped = self.visit_arg(arg)
-            if i + 1 < len(args) and not skipped:
-                self += ", "
+        if types is None:
+            types = {}
 
-    def visit_arg(self, node):
-        """ Handle definitions of function arguments. """
+        parameters = (self.parameter(arg, types) for arg in args)
+        return ", ".join(parameter for parameter in parameters if parameter)
+
+    def parameter(self, node, types):
+        """Get the declaration of a function argument, None for self.
+
+        Large values that the function never modifies are passed by const
+        reference rather than copied, or as a std::string_view for strings
+        that are only read in ways a view supports.
+        """
         arg = node.arg
-        print(f"Handling function arg: {arg}")
+        logger.debug("Handling function arg: %s", arg)
 
         if arg == "self" and self.current_class:
-            return True
+            return None
 
         annotation = node.annotation
         if annotation is None:
             raise CompileError(f"Unknown type for {arg}")
 
-        if isinstance(annotation, Name):
-            type_ = annotation.id
+        cpp_type = self.annotation_type(annotation)
+        types[arg] = cpp_type
+
+        # A parameter hides any global container of the same name
+        if cpp_type.startswith("std::vector"):
+            self.objects[arg] = "std::vector"
         else:
-            type_ = annotation.value
+            self.objects.pop(arg, None)
+
+        logger.debug("Handling %s: %s", arg, cpp_type)
+        if cpp_type == "std::string" and arg in self.viewed:
+            return f"{self.declare_type('std::string_view')} {arg}"
 
-        cpp_type = self.get_type(type_)
+        if is_large(cpp_type, self.classes) and arg not in self.mutated:
+            return f"const {cpp_type}& {arg}"
 
-        print(f"Handling {type_} {arg}: {cpp_type}")
-        self += f"{cpp_type} {arg}"
+        return f"{cpp_type} {arg}"
+
+    def visit_operand(self, node, precedence, right=False):
+        """Visit an operand of an operator with the given precedence.
+
+        The operand is parenthesised if it would otherwise bind more loosely
+        than the operator, or as loosely when it is on the right.
+        """
+
+        inner = expression_precedence(node)
+        if inner > precedence or (right and inner and inner == precedence):
+            self += "("
+            self.visit(node)
+            self += ")"
+        else:
+            self.visit(node)
 
     def visit_BinOp(self, node):
-        print(f"Handling binary operator: {node.op}")
+        logger.debug("Handling binary operator: %s", node.op)
+
+        repeated = repeated_list(node)
+        if repeated is not None:
+            self.repeated_list(*repeated)
+            return
+
+        # Each + of std::strings would allocate a temporary
+        if self.inference is not None:
+            pieces = self.concatenated(node)
+            if len(pieces) > 2:
+                self.join_strings(pieces)
+                return
+
         op = get_operator(node.op)
+        precedence = get_precedence(node.op)
 
-        self.visit(node.left)
+        # Python's / divides ints as doubles, where c++ would truncate
+        if isinstance(node.op, Div) and self.integer_division(node):
+            self += "static_cast<double>("
+            self.visit(node.left)
+            self += ")"
+        else:
+            self.visit_operand(node.left, precedence)
         self += f" {op} "
-        self.visit(node.right)
+        self.visit_operand(node.right, precedence, right=True)
+
+    def integer_division(self, node):
+        """ Check whether both operands of a division are integers in c++. """
+
+        for operand in (node.left, node.right):
+            if self.inference is not None:
+                cpp_type = self.inference.type_of(operand)
+            else:
+                cpp_type = CONSTANT_TYPES.get(type(getattr(operand, "value", None)))
+
+            if cpp_type not in ("int", "bool"):
+                return False
+
+        return True
+
+    def repeated_list(self, element, count):
+        """ Emit `[element] * count` as a vector of count copies of element. """
+
+        if self.inference is not None:
+            element_type = self.inference.type_of(element)
+        else:
+            element_type = CONSTANT_TYPES.get(type(getattr(element, "value", None)))
+
+        if element_type is None:
+            raise CompileError("Unknown element type of repeated list")
+
+        self += f"{self.declare_type(list_type(element_type))}("
+        self.visit(count)
+        self += ", "
+        self.visit(element)
+        self += ")"
 
     def visit_UnaryOp(self, node):
-        print(f"Handling unary operator: {node.op}")
+        logger.debug("Handling unary operator: %s", node.op)
         op = get_operator(node.op)
 
         self += op
-        self.visit(node.operand)
+        self.visit_operand(node.operand, get_precedence(node.op), right=True)
 
     def visit_BoolOp(self, node):
-        print(f"Handling boolean operator: {node.op}")
-        op = OPERATORS.get(type(node.op))
-
-        if not op:
-            raise CompileError(f"{node.op} is an unsupported binary operator")
+        logger.debug("Handling boolean operator: %s", node.op)
+        op = get_operator(node.op)
+        precedence = get_precedence(node.op)
 
         for i, value in enumerate(node.values):
-            self.visit(value)
+            self.visit_operand(value, precedence, right=i > 0)
             if i + 1 < len(node.values):
                 self += f" {op} "
 
@@ -458,14 +1494,15 @@ class Converter(ast.NodeVisitor):
 
         last_operand = left
         for op, operand in zip(ops, operands):
+            precedence = get_precedence(op)
             op = get_operator(op)
 
             if last_operand != left:
                 self += " && "
 
-            self.visit(last_operand)
+            self.visit_operand(last_operand, precedence)
             self += f" {op} "
-            self.visit(operand)
+            self.visit_operand(operand, precedence, right=True)
 
             last_operand = operand
 
@@ -486,37 +1523,214 @@ class Converter(ast.NodeVisitor):
 
         self.handle_body(body)
 
-        if len(orelse) > 1:
-            raise CompileError("More than one elif node, unknown action")
+        # Only an else holding nothing but an if statement is an elif
+        if len(orelse) == 1 and isinstance(orelse[0], If):
+            self += "}else "
+            self.visit_If(orelse[0])
+        elif orelse:
+            self.end_line("}else {")
+            self.handle_body(orelse)
+            self.end_line("}")
+        else:
+            self.end_line("}")
 
-        if orelse:
-            else_node = orelse[0]
-            if isinstance(else_node, If):
-                self += "}else "
-                self.visit_If(else_node)
-            else:
-                self.end_line("}else {")
+    def render(self, node):
+        """ Get the c++ source of an expression without emitting it. """
+
+        state = self.state
+        emitter, line_start = self.emitter, state.line_start
+
+        self.emitter = StringEmitter()
+        state.line_start = False
+        try:
+            self.visit(node)
+            return self.emitter.getvalue()
+        finally:
+            self.emitter, state.line_start = emitter, line_start
 
-                with CompileFlag(self, "indent"):
-                    self.visit(else_node)
+    def hidden_name(self, hint):
+        """ Get a fresh name for a variable that doesn't exist in the source. """
 
-                self.end_line("}")
+        self.hidden += 1
+        return f"_{hint}_{self.hidden}"
+
+    def loop_bound(self, node, body, hint):
+        """Get c++ source for a value that python evaluates once per loop.
+
+        Names that the loop body never assigns and constants are used as they
+        are. Anything else is returned as a declaration to hoist into the loop
+        initialiser, along with the name of the hoisted variable.
+        """
+
+        value = simple_value(node)
+        if value is not None and not (isinstance(node, Name) and assigns(body, value)):
+            return value, None
+
+        name = self.hidden_name(hint)
+        return name, f"{name} = {self.render(node)}"
+
+    def range_loop(self, node, args):
+        """ Get the header of a counted loop over range(start, stop, step). """
+
+        target = node.target
+        if not isinstance(target, Name):
+            raise CompileError("range() can only be unpacked into a single name")
+
+        if not 1 <= len(args) <= 3:
+            raise CompileError(f"range expected 1 to 3 arguments, got {len(args)}")
+
+        start, step = "0", "1"
+        if len(args) == 1:
+            stop = args[0]
         else:
-            self.end_line("}")
+            start, stop = self.render(args[0]), args[1]
+
+        declarations = []
+        stop, declaration = self.loop_bound(stop, node.body, "stop")
+        if declaration:
+            declarations.append(declaration)
+
+        step_value = 1
+        if len(args) == 3:
+            step, declaration = self.loop_bound(args[2], node.body, "step")
+            if declaration:
+                declarations.append(declaration)
+
+            step_value = integer_value(args[2])
+
+        if step_value == 0:
+            raise CompileError("range() arg 3 must not be zero")
+
+        # Python evaluates range() once, so assigning to the loop variable in
+        # the body must not change the iteration. Count with a hidden variable
+        # if the body does that.
+        name = target.id
+        bindings = []
+        if assigns(node.body, name):
+            counter = self.hidden_name(name)
+            bindings.append(f"int {name} = {counter};")
+        else:
+            counter = name
 
-    def visit_For(self, node):
+        if step_value is None:
+            condition = f"{step} > 0 ? {counter} < {stop} : {counter} > {stop}"
+        elif step_value > 0:
+            condition = f"{counter} < {stop}"
+        else:
+            condition = f"{counter} > {stop}"
+
+        initialiser = ", ".join([f"int {counter} = {start}", *declarations])
+        return f"for ({initialiser}; {condition}; {counter} += {step})", bindings
+
+    def indexed_sequence(self, node):
+        """ Get the name of a sequence that can be walked by index. """
+
+        if not isinstance(node, Name):
+            raise CompileError("Only named lists can be iterated by index")
+
+        if self.objects.get(node.id) == "std::tuple":
+            raise CompileError("Tuples of mixed types can't be iterated by index")
+
+        return node.id
+
+    def enumerate_loop(self, node, args):
+        """ Get the header of an index loop over enumerate(sequence, start). """
 
         target = node.target
+        if not (
+            isinstance(target, Tuple)
+            and len(target.elts) == 2
+            and all(isinstance(element, Name) for element in target.elts)
+        ):
+            raise CompileError("enumerate() must be unpacked into two names")
 
-        if not isinstance(target, Name):
-            raise CompileError("C++ does not support multiple targets in a loop")
+        if not 1 <= len(args) <= 2:
+            raise CompileError(f"enumerate expected 1 or 2 arguments, got {len(args)}")
+
+        sequence = self.indexed_sequence(args[0])
+        start = self.render(args[1]) if len(args) == 2 else "0"
+
+        index, element = (element.id for element in target.elts)
+        counter = self.hidden_name("index")
+
+        bindings = [f"auto&& {element} = {sequence}[{counter}];"]
+        if start == "0":
+            bindings.insert(0, f"int {index} = {counter};")
+        else:
+            bindings.insert(0, f"int {index} = {counter} + {start};")
+
+        size = f"static_cast<int>({sequence}.size())"
+        return f"for (int {counter} = 0; {counter} < {size}; {counter} += 1)", bindings
+
+    def zip_loop(self, node, args):
+        """ Get the header of an index loop over zip(first, second, ...). """
+
+        target = node.target
+        if not (
+            isinstance(target, Tuple)
+            and len(target.elts) == len(args)
+            and all(isinstance(element, Name) for element in target.elts)
+        ):
+            raise CompileError("zip() must be unpacked into one name per sequence")
+
+        if not args:
+            raise CompileError("zip() needs at least one sequence")
+
+        sequences = [self.indexed_sequence(arg) for arg in args]
+        counter = self.hidden_name("index")
+
+        condition = " && ".join(
+            f"{counter} < static_cast<int>({sequence}.size())" for sequence in sequences
+        )
+        bindings = [
+            f"auto&& {element.id} = {sequence}[{counter}];"
+            for element, sequence in zip(target.elts, sequences)
+        ]
+
+        return f"for (int {counter} = 0; {condition}; {counter} += 1)", bindings
+
+    def visit_For(self, node):
+
+        target = node.target
 
         if node.orelse:
             raise CompileError("C++ does not support else statements on loops")
 
         iterable = node.iter
+        self.reserve_appends(node)
+        self.reserve_concatenations(node)
+
+        loops = {
+            "range": self.range_loop,
+            "enumerate": self.enumerate_loop,
+            "zip": self.zip_loop,
+        }
+
+        if (
+            isinstance(iterable, Call)
+            and isinstance(iterable.func, Name)
+            and iterable.func.id in loops
+            and not iterable.keywords
+        ):
+            header, bindings = loops[iterable.func.id](node, iterable.args)
+
+            self.end_line(f"{header} {{")
+            with CompileFlag(self.state, "indent"):
+                for binding in bindings:
+                    self.end_line(binding)
+
+            for name in ast.walk(target):
+                if isinstance(name, Name):
+                    self.delcared.add(name.id)
+
+            self.handle_body(node.body)
+            self.end_line("}")
+            return
+
+        if not isinstance(target, Name):
+            raise CompileError("C++ does not support multiple targets in a loop")
 
-        self += "for (auto& "
+        self += "for (auto&& "
         self.visit(target)
         self += " : "
         self.visit(iterable)
@@ -525,11 +1739,56 @@ class Converter(ast.NodeVisitor):
         self.handle_body(node.body)
         self.end_line("}")
 
+    def reserve_appends(self, node):
+        """ Reserve room for lists that a loop appends to a known amount. """
+
+        if isinstance(node, For):
+            trips = loop_trips(node)
+            counted = None if trips is None else (*trips, loop_appends(node))
+        else:
+            counted = counted_appends(node)
+
+        if counted is None:
+            return
+
+        condition, trips, appends = counted
+        if " " in trips:
+            trips = f"({trips})"
+
+        for name, count in appends.items():
+            if self.objects.get(name) != "std::vector":
+                continue
+
+            size = trips if count == 1 else f"{count} * {trips}"
+            reserve = f"{self.use_support('reserve_more')}({name}, {size});"
+            self.end_line(f"if ({condition}) {reserve}" if condition else reserve)
+
+    def reserve_concatenations(self, node):
+        """ Reserve room for the strings a for loop appends literal text to. """
+
+        trips = loop_trips(node) if self.inference is not None else None
+        if trips is None:
+            return
+
+        condition, count = trips
+        if " " in count:
+            count = f"({count})"
+
+        for name, length in appended_lengths(node.body).items():
+            if self.inference.env.get(name) != "std::string":
+                continue
+
+            size = count if length == 1 else f"{length} * {count}"
+            reserve = f"{self.use_support('reserve_more')}({name}, {size});"
+            self.end_line(f"if ({condition}) {reserve}" if condition else reserve)
+
     def visit_While(self, node):
 
         if node.orelse:
             raise CompileError("C++ does not support else statements on for loops")
 
+        self.reserve_appends(node)
+
         self += "while "
         self.handle_test(node.test)
         self.end_line("{")
@@ -549,17 +1808,127 @@ class Converter(ast.NodeVisitor):
         body = node.body
 
         self.current_class = name
+        self.structs.append(name)
 
         extends = ", ".join(base.id for base in bases)
         if extends:
-            extends = f": {extends}"
-
-        self.end_line(f"struct {name}{extends} {{")
-
-        self.handle_body(body)
+            extends = f" : {extends}"
+
+        # Without subclasses there is nothing for calls to dispatch between
+        final = ""
+        if self.subclassed is not None and name not in self.subclassed:
+            final = " final"
+
+        fields = self.field_layout(node)
+        self.fields = [field.target.id for field in fields]
+
+        self.end_line(f"struct {name}{final}{extends} {{")
+
+        with CompileFlag(self.state, "indent"):
+            for field in fields:
+                self.visit(field)
+
+            # Python classes without an __init__ inherit their base's
+            if not any(
+                isinstance(statement, FunctionDef) and statement.name == "__init__"
+                for statement in body
+            ):
+                for base in bases:
+                    self.end_line(f"using {base.id}::{base.id};")
+
+        self.handle_body(
+            [
+                statement
+                for statement in body
+                if not (isinstance(statement, AnnAssign) or is_slots(statement))
+            ]
+        )
 
         self.end_line("};")
         self.current_class = ""
+        self.fields = []
+
+    def type_layout(self, cpp_type):
+        """Get the size and alignment of cpp_type, None if they aren't known.
+
+        Sizes are those of a 64 bit build against libstdc++.
+        """
+
+        if cpp_type in TYPE_LAYOUTS:
+            return TYPE_LAYOUTS[cpp_type]
+
+        if cpp_type.startswith("std::vector<"):
+            return TYPE_LAYOUTS["std::vector"]
+
+        if cpp_type.startswith("std::array<"):
+            element, count = cpp_type[len("std::array<") : -1].rsplit(",", 1)
+            layout = self.type_layout(element.strip())
+            if layout is not None:
+                size, alignment = layout
+                return size * int(count), alignment
+
+        return self.struct_layouts.get(cpp_type)
+
+    def field_layout(self, node):
+        """Get the field declarations of a class, ordered to minimise padding.
+
+        Fields are sorted by decreasing alignment, those of unknown layout
+        counted as pointer aligned, which leaves padding only at the end of
+        the struct. The struct's resulting size is logged, when known.
+        """
+
+        fields = []
+        for name, annotation, value in class_fields(node):
+            if annotation is None:
+                raise CompileError(f"Unknown type for field {name} of {node.name}")
+
+            field = AnnAssign(
+                target=Name(id=name, ctx=ast.Store()),
+                annotation=annotation,
+                value=value,
+                simple=1,
+            )
+            fields.append(ast.copy_location(field, annotation))
+
+        layouts = [
+            self.type_layout(self.resolve_annotation(field.annotation))
+            for field in fields
+        ]
+        order = sorted(
+            range(len(fields)),
+            key=lambda index: -(layouts[index] or POINTER_LAYOUT)[1],
+        )
+
+        # Fields of a base class come first; only the common case of a single
+        # base defined in this module is measured
+        offset, alignment = 0, 1
+        if node.bases:
+            base = node.bases[0].id if len(node.bases) == 1 else None
+            offset, alignment = self.struct_layouts.get(base, (None, 1))
+
+        start = offset
+        for index in order:
+            layout = layouts[index]
+            if layout is None or offset is None:
+                offset = None
+                break
+
+            size, field_alignment = layout
+            offset += -offset % field_alignment + size
+            alignment = max(alignment, field_alignment)
+
+        if offset is None:
+            logger.info("struct %s: size unknown", node.name)
+        else:
+            # An empty struct still takes a byte
+            size = max(offset + -offset % alignment, 1)
+            padding = size - start - sum(layouts[index][0] for index in order)
+            self.struct_layouts[node.name] = size, alignment
+            logger.info(
+                "struct %s: %d bytes, %d of them padding", node.name, size, padding
+            )
+
+        return [fields[index] for index in order]
 
     def visit_Try(self, node):
 
@@ -581,7 +1950,7 @@ class Converter(ast.NodeVisitor):
 
         type_ = node.type
         name = node.name
-        print(f"Hanlind exception handler {type_.id} {name}")
+        logger.debug("Handling exception handler %s %s", type_.id, name)
 
         try:
             cpp_type = get_exception_type(type_.id)
@@ -604,23 +1973,57 @@ class Converter(ast.NodeVisitor):
         self.end_line()
 
     def __iadd__(self, value):
-        indent = " " * (SPACES_PER_TAB * self.indent * self.line_start)
+        state = self.state
+        indent = state.indent if state.line_start else 0
 
-        self.line_start = False
+        state.line_start = False
 
-        string = f"{indent}{value}"
-        print(f"Adding: {string}")
-        self.code.append(string)
+        logger.debug("Adding: %s", value)
+        self.emitter.write(str(value), indent)
 
         return self
 
-    def report(self):
-        string = []
-        for include in self.includes:
-            string.append(f"#include {include}\n")
+    def write(self, output):
+        """ Write the includes followed by the generated code to output. """
 
-        string.append("\n\n")
-        for item in self.code:
-            string.append(item)
+        header = "".join(f"#include {include}\n" for include in sorted(self.includes))
+        header += "".join(f'#include "{path}"\n' for path in self.imports.values())
+        self.emitter.finish(output, f"{header}{self.support_code()}\n\n")
+
+    def support_code(self):
+        """ Get the runtime helpers used, in the order SUPPORT lists them. """
+
+        return "".join(
+            f"\n{code}" for name, (code, _) in SUPPORT.items() if name in self.support
+        )
+
+    def forward_declarations(self):
+        lines = ["#pragma once"]
+        lines.extend(f"#include {include}" for include in sorted(self.includes))
+        lines.extend(f'#include "{path}"' for path in self.imports.values())
+
+        lines.append("")
+        lines.extend(f"struct {name};" for name in self.structs)
+        lines.extend(f"{signature};" for signature in self.declarations)
+
+        return "".join(f"{line}\n" for line in lines)
+
+    def write_shards(self, outputs, header, include):
+        """Write the module as a header and a source for each shard.
+
+        The header declares everything and defines the classes, along with
+        the runtime helpers; each source includes it, by the name include,
+        followed by its share of the functions.
+        """
+
+        declarations = self.forward_declarations()
+        self.emitter.finish(header, f"{declarations}{self.support_code()}\n")
+
+        for output, emitter in zip(outputs, self.shard_emitters):
+            emitter.finish(output, f'#include "{include}"\n\n')
+
+    def report(self):
+        output = io.StringIO()
+        self.write(output)
 
-        return "".join(string)
+        return output.getvalue()
@@ -0,0 +1,531 @@
+import ast
+import logging
+import math
+import operator
+import time
+from ast import (
+    Add,
+    And,
+    Assign,
+    BinOp,
+    BitAnd,
+    BitOr,
+    BitXor,
+    BoolOp,
+    Break,
+    Compare,
+    Constant,
+    Continue,
+    Div,
+    Eq,
+    Expr,
+    FloorDiv,
+    For,
+    Gt,
+    GtE,
+    Invert,
+    Load,
+    LShift,
+    Lt,
+    LtE,
+    Mod,
+    Mult,
+    Name,
+    Not,
+    NotEq,
+    Raise,
+    Return,
+    RShift,
+    Store,
+    Sub,
+    UAdd,
+    UnaryOp,
+    USub,
+    While,
+)
+
+logger = logging.getLogger(__name__)
+
+# Division and modulo are left out, as python's differ from the c++ ones they
+# translate to: 7 / 2 is 3.5 but 3 in c++, and -7 // 2 and -7 % 3 round down
+# rather than towards zero
+BINARY_OPERATORS = {
+    Add: operator.add,
+    Sub: operator.sub,
+    Mult: operator.mul,
+    LShift: operator.lshift,
+    RShift: operator.rshift,
+    BitOr: operator.or_,
+    BitAnd: operator.and_,
+    BitXor: operator.xor,
+}
+
+UNARY_OPERATORS = {
+    UAdd: operator.pos,
+    USub: operator.neg,
+    Not: operator.not_,
+    Invert: operator.invert,
+}
+
+COMPARISONS = {
+    Eq: operator.eq,
+    NotEq: operator.ne,
+    Lt: operator.lt,
+    LtE: operator.le,
+    Gt: operator.gt,
+    GtE: operator.ge,
+}
+
+# Operators that raise on some operands, so may only run where python would
+PARTIAL_OPERATORS = (Div, FloorDiv, Mod, LShift, RShift)
+
+# Statements after which nothing else in the same block can run
+TERMINATORS = (Return, Raise, Break, Continue)
+
+INT_MIN, INT_MAX = -(2 ** 31), 2 ** 31 - 1
+
+
+def representable(value):
+    """ Check that a folded value means the same thing as a c++ literal. """
+
+    if isinstance(value, bool) or isinstance(value, str):
+        return True
+
+    if isinstance(value, int):
+        return INT_MIN <= value <= INT_MAX
+
+    if isinstance(value, float):
+        return math.isfinite(value)
+
+    return False
+
+
+class Pass(ast.NodeTransformer):
+    """An optimisation of the tree of a module, run before it is translated.
+
+    Subclasses count each rewrite they make in changes, and give any node
+    they create the location of the code it replaces.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.changes = 0
+
+    def run(self, tree):
+        return self.visit(tree)
+
+
+class StatementPass(Pass):
+    """A pass that only rewrites statements.
+
+    Only blocks of statements are walked, never the expressions in them.
+    A visitor may return a list of statements to replace a statement with,
+    or None to remove it.
+    """
+
+    def ends_block(self, statement):
+        """ Check whether nothing after statement in its block can run. """
+
+        return False
+
+    def block(self, statements):
+        body = []
+        for index, statement in enumerate(statements):
+            statement = self.visit(statement)
+            if statement is None:
+                continue
+
+            if isinstance(statement, list):
+                body.extend(statement)
+            else:
+                body.append(statement)
+
+            if body and self.ends_block(body[-1]):
+                self.changes += len(statements) - index - 1
+                break
+
+        return body
+
+    def generic_visit(self, node):
+        for field in ("body", "orelse", "finalbody"):
+            statements = getattr(node, field, None)
+            if isinstance(statements, list):
+                setattr(node, field, self.block(statements))
+
+        for handler in getattr(node, "handlers", ()):
+            handler.body = self.block(handler.body)
+
+        return node
+
+
+class ConstantFolding(Pass):
+    """ Evaluate operators whose operands are all constants. """
+
+    name = "fold"
+
+    # Nodes that have no operators below them
+    LEAVES = (Constant, Name, ast.expr_context, ast.operator, ast.cmpop, ast.boolop)
+
+    def visit(self, node):
+        if isinstance(node, self.LEAVES):
+            return node
+
+        return super().visit(node)
+
+    def generic_visit(self, node):
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for index, item in enumerate(value):
+                    if isinstance(item, ast.AST):
+                        value[index] = self.visit(item)
+            elif isinstance(value, ast.AST):
+                setattr(node, field, self.visit(value))
+
+        return node
+
+    def fold(self, node, compute):
+        try:
+            value = compute()
+        except (ArithmeticError, TypeError, ValueError):
+            return node
+
+        if not representable(value):
+            return node
+
+        self.changes += 1
+        return ast.copy_location(Constant(value=value), node)
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+
+        function = BINARY_OPERATORS.get(type(node.op))
+        left, right = node.left, node.right
+        if function is None or not (
+            isinstance(left, Constant) and isinstance(right, Constant)
+        ):
+            return node
+
+        # c++ can't multiply strings, so only fold strings that are joined
+        if isinstance(left.value, str) and not isinstance(node.op, Add):
+            return node
+
+        return self.fold(node, lambda: function(left.value, right.value))
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+
+        function = UNARY_OPERATORS.get(type(node.op))
+        operand = node.operand
+        if function is None or not isinstance(operand, Constant):
+            return node
+
+        if isinstance(operand.value, str):
+            return node
+
+        return self.fold(node, lambda: function(operand.value))
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+
+        # python's and/or return an operand rather than a bool, which only
+        # matches c++ when the operands are bools
+        values = node.values
+        if not all(
+            isinstance(value, Constant) and type(value.value) is bool
+            for value in values
+        ):
+            return node
+
+        combine = all if isinstance(node.op, And) else any
+        return self.fold(node, lambda: combine(value.value for value in values))
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+
+        operands = [node.left, *node.comparators]
+        if not all(isinstance(operand, Constant) for operand in operands):
+            return node
+
+        functions = [COMPARISONS.get(type(op)) for op in node.ops]
+        if None in functions:
+            return node
+
+        values = [operand.value for operand in operands]
+        return self.fold(
+            node,
+            lambda: all(
+                function(left, right)
+                for function, left, right in zip(functions, values, values[1:])
+            ),
+        )
+
+
+class DeadCodeElimination(StatementPass):
+    """Remove statements that can never run or have no effect.
+
+    Code following a return, raise, break or continue is dropped, as are
+    branches and loops whose condition is a false constant and expression
+    statements that are just a constant, such as docstrings.
+    """
+
+    name = "dce"
+
+    def ends_block(self, statement):
+        return isinstance(statement, TERMINATORS)
+
+    def visit_If(self, node):
+        self.generic_visit(node)
+
+        test = node.test
+        if not isinstance(test, Constant):
+            return node
+
+        # The taken branch joins the enclosing block
+        self.changes += 1
+        return node.body if test.value else node.orelse
+
+    def visit_While(self, node):
+        self.generic_visit(node)
+
+        test = node.test
+        if isinstance(test, Constant) and not test.value:
+            self.changes += 1
+            return node.orelse
+
+        return node
+
+    def visit_Expr(self, node):
+        if isinstance(node.value, Constant):
+            self.changes += 1
+            return None
+
+        return node
+
+
+def safe_divisor(node):
+    """ Check that the right operand of a division or shift can't raise. """
+
+    right = node.right
+    if not isinstance(right, Constant) or type(right.value) not in (int, float):
+        return False
+
+    if isinstance(node.op, (LShift, RShift)):
+        return right.value >= 0
+
+    return right.value != 0
+
+
+class LoopInvariantHoisting(StatementPass):
+    """Compute arithmetic that doesn't change between iterations before a loop.
+
+    Only operators on constants and on names the loop never assigns are
+    moved, and never ones that could raise, as the loop might not run at
+    all. Each hoisted expression is stored in a new variable.
+    """
+
+    name = "hoist"
+
+    HOISTABLE = (BinOp, UnaryOp, BoolOp, Compare)
+
+    # Nodes that are neither variables nor contain any
+    SYMBOLS = (ast.expr_context, ast.operator, ast.unaryop, ast.cmpop, ast.boolop)
+
+    # Constants and operators are invariant, and never hoisted alone
+    LEAVES = (Constant, *SYMBOLS)
+
+    def __init__(self):
+        super().__init__()
+        self.names = set()
+
+        # Names assigned inside each loop already visited, by id
+        self.stored = {}
+
+    def stored_names(self, node):
+        """ Get the names that node assigns to, reusing those of inner loops. """
+
+        names = set()
+        pending = [node]
+        while pending:
+            child = pending.pop()
+
+            if child is not node and isinstance(child, (While, For)):
+                names |= self.stored[id(child)]
+                continue
+
+            if isinstance(child, Name):
+                if isinstance(child.ctx, Store):
+                    names.add(child.id)
+                continue
+
+            pending.extend(
+                grandchild
+                for grandchild in ast.iter_child_nodes(child)
+                if not isinstance(grandchild, self.LEAVES)
+            )
+
+        return names
+
+    def hoisted_name(self, statement):
+        """ Get the variable that statement assigns, if this pass made it. """
+
+        if isinstance(statement, Assign) and len(statement.targets) == 1:
+            target = statement.targets[0]
+            if isinstance(target, Name) and target.id in self.names:
+                return target.id
+
+        return None
+
+    def invariant(self, node, variant):
+        """ Check whether node could be hoisted out of a loop assigning variant. """
+
+        if isinstance(node, Constant):
+            return True
+
+        if isinstance(node, Name):
+            return node.id not in variant
+
+        if isinstance(node, BinOp) and isinstance(node.op, PARTIAL_OPERATORS):
+            if not safe_divisor(node):
+                return False
+
+        return isinstance(node, self.HOISTABLE) and all(
+            self.invariant(child, variant)
+            for child in ast.iter_child_nodes(node)
+            if isinstance(child, ast.expr)
+        )
+
+    def hoist(self, node, variant, hoisted):
+        """Hoist the largest invariant expressions below node into hoisted.
+
+        Returns whether node itself is invariant, leaving it to the caller to
+        hoist it as part of something larger.
+        """
+
+        if isinstance(node, Constant) or isinstance(node, self.SYMBOLS):
+            return True
+
+        if isinstance(node, Name):
+            return node.id not in variant
+
+        # Loops inside the body were already hoisted out of, into this one
+        if isinstance(node, (While, For)):
+            return False
+
+        leaves = self.LEAVES
+        children = []
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for index, item in enumerate(value):
+                    if isinstance(item, ast.AST) and not isinstance(item, leaves):
+                        children.append((value, index, item))
+            elif isinstance(value, ast.AST) and not isinstance(value, leaves):
+                children.append((node, field, value))
+
+        invariant = [self.hoist(child, variant, hoisted) for _, _, child in children]
+
+        if isinstance(node, self.HOISTABLE) and all(invariant):
+            if not isinstance(node, BinOp):
+                return True
+
+            if not isinstance(node.op, PARTIAL_OPERATORS) or safe_divisor(node):
+                return True
+
+        for (parent, key, child), child_invariant in zip(children, invariant):
+            if child_invariant and isinstance(child, self.HOISTABLE):
+                name = self.hoist_expression(child, hoisted)
+                if isinstance(parent, list):
+                    parent[key] = name
+                else:
+                    setattr(parent, key, name)
+
+        return False
+
+    def hoist_expression(self, node, hoisted):
+        """ Assign node to a new variable before the loop, returning its name. """
+
+        self.changes += 1
+
+        name = f"_invariant_{len(self.names) + 1}"
+        self.names.add(name)
+
+        target = ast.copy_location(Name(id=name, ctx=Store()), node)
+        hoisted.append(ast.copy_location(Assign(targets=[target], value=node), node))
+
+        return ast.copy_location(Name(id=name, ctx=Load()), node)
+
+    def visit_FunctionDef(self, node):
+        # Number the variables of each function from one, so that hoisting in
+        # one function doesn't rename those of the functions after it
+        names, self.names = self.names, set()
+        node = self.generic_visit(node)
+        self.names = names
+
+        return node
+
+    def visit_loop(self, node, parts):
+        self.generic_visit(node)
+
+        variant = self.stored_names(node)
+
+        # Values hoisted out of inner loops may be invariant here too, in
+        # which case their assignments move out as they are
+        hoisted = []
+        for statement in list(node.body):
+            name = self.hoisted_name(statement)
+            if name and self.invariant(statement.value, variant - {name}):
+                node.body.remove(statement)
+                hoisted.append(statement)
+                variant.discard(name)
+
+        self.stored[id(node)] = variant
+
+        for part in parts:
+            for statement in part:
+                self.hoist(statement, variant, hoisted)
+
+        return [*hoisted, node]
+
+    def visit_While(self, node):
+        test = Expr(value=node.test)
+        hoisted = self.visit_loop(node, ([test], node.body))
+        node.test = test.value
+
+        return hoisted
+
+    def visit_For(self, node):
+        return self.visit_loop(node, (node.body,))
+
+
+PASSES = {
+    transform.name: transform
+    for transform in (ConstantFolding, DeadCodeElimination, LoopInvariantHoisting)
+}
+
+
+def run_passes(tree, names=tuple(PASSES), profile=None, location=""):
+    """Run the named passes over tree in pipeline order, returning the result.
+
+    The time taken by each pass is recorded into profile if one is given.
+    """
+
+    for name, transform in PASSES.items():
+        if name not in names:
+            continue
+
+        start = time.perf_counter()
+
+        optimisation = transform()
+        tree = optimisation.run(tree)
+
+        elapsed = time.perf_counter() - start
+        if profile is not None:
+            profile.record(f"pass_{name}", location, elapsed)
+
+        logger.info(
+            "Pass %s made %d changes in %.3fs", name, optimisation.changes, elapsed
+        )
+
+    return tree
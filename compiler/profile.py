@@ -0,0 +1,91 @@
+import json
+
+
+class ProfileEntry:
+    """ Call count and cumulative time spent in one visitor or source line. """
+
+    __slots__ = ("calls", "time")
+
+    def __init__(self, calls=0, time=0.0):
+        self.calls = calls
+        self.time = time
+
+    def to_dict(self):
+        return {"calls": self.calls, "time": self.time}
+
+
+class TranslationProfile:
+    """Statistics collected by a Converter running in profile mode.
+
+    Times are cumulative: the time recorded for a node includes the time
+    spent visiting its children, in the same way as cProfile's cumtime.
+    """
+
+    def __init__(self):
+        self.visitors = {}
+        self.lines = {}
+
+    def record(self, visitor, location, elapsed):
+        for table, key in ((self.visitors, visitor), (self.lines, location)):
+            entry = table.get(key)
+            if entry is None:
+                entry = table[key] = ProfileEntry()
+
+            entry.calls += 1
+            entry.time += elapsed
+
+    def merge(self, other):
+        for table, other_table in (
+            (self.visitors, other.visitors),
+            (self.lines, other.lines),
+        ):
+            for key, other_entry in other_table.items():
+                entry = table.get(key)
+                if entry is None:
+                    entry = table[key] = ProfileEntry()
+
+                entry.calls += other_entry.calls
+                entry.time += other_entry.time
+
+    def to_dict(self):
+        return {
+            "visitors": {key: entry.to_dict() for key, entry in self.visitors.items()},
+            "lines": {key: entry.to_dict() for key, entry in self.lines.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls()
+        for table, key in ((profile.visitors, "visitors"), (profile.lines, "lines")):
+            for name, entry in data.get(key, {}).items():
+                table[name] = ProfileEntry(entry["calls"], entry["time"])
+
+        return profile
+
+    def dump_json(self, path):
+        with open(path, "w") as profile_file:
+            json.dump(self.to_dict(), profile_file, indent=2, sort_keys=True)
+
+    @classmethod
+    def load_json(cls, path):
+        with open(path, "r") as profile_file:
+            return cls.from_dict(json.load(profile_file))
+
+    def table(self, limit=20):
+        """ Format the most expensive visitors and lines as text tables. """
+
+        sections = []
+        for title, table in (("visitor", self.visitors), ("line", self.lines)):
+            rows = sorted(table.items(), key=lambda item: item[1].time, reverse=True)
+            if limit is not None:
+                rows = rows[:limit]
+
+            width = max([len(title), *(len(key) for key, _ in rows)])
+
+            lines = [f"{title:<{width}}  {'calls':>8}  {'cumtime (s)':>12}"]
+            for key, entry in rows:
+                lines.append(f"{key:<{width}}  {entry.calls:>8}  {entry.time:>12.6f}")
+
+            sections.append("\n".join(lines))
+
+        return "\n\n".join(sections)
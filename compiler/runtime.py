@@ -0,0 +1,105 @@
+""" C++ support code that translated modules may need. """
+
+# Each helper is guarded so that a unity build can merge modules using it
+FORMAT_FLOAT = r"""#ifndef PYTHON_TO_CPP_FORMAT_FLOAT
+#define PYTHON_TO_CPP_FORMAT_FLOAT
+// Format a double the way python's repr() does
+inline std::string format_float(double value) {
+    if (std::isnan(value)) return "nan";
+    if (std::isinf(value)) return value > 0 ? "inf" : "-inf";
+
+    // Shortest digits that round trip, as python uses, like -1.25e+02
+    char buffer[32];
+    *std::to_chars(
+        buffer, buffer + sizeof buffer - 1, value, std::chars_format::scientific
+    ).ptr = '\0';
+
+    std::string result;
+    const char* digit = buffer;
+    if (*digit == '-') {
+        result += '-';
+        ++digit;
+    }
+
+    std::string digits;
+    for (; *digit != 'e'; ++digit) {
+        if (*digit != '.') digits += *digit;
+    }
+    int exponent = std::atoi(digit + 1);
+    int count = static_cast<int>(digits.size());
+
+    if (exponent < -4 || exponent >= 16) {
+        result += digits[0];
+        if (count > 1) result += '.' + digits.substr(1);
+
+        result += exponent < 0 ? "e-" : "e+";
+        if (std::abs(exponent) < 10) result += '0';
+        result += std::to_string(std::abs(exponent));
+    } else if (exponent < 0) {
+        result += "0." + std::string(-exponent - 1, '0') + digits;
+    } else if (exponent + 1 >= count) {
+        result += digits + std::string(exponent + 1 - count, '0') + ".0";
+    } else {
+        result += digits.substr(0, exponent + 1) + '.' + digits.substr(exponent + 1);
+    }
+
+    return result;
+}
+#endif
+"""
+
+JOIN_STRINGS = r"""#ifndef PYTHON_TO_CPP_JOIN_STRINGS
+#define PYTHON_TO_CPP_JOIN_STRINGS
+// Get the text python's str() gives a value, as a string or a view of one
+template <typename T>
+inline auto to_text(const T& value) {
+    if constexpr (std::is_same_v<T, bool>) {
+        return std::string_view(value ? "True" : "False");
+    } else if constexpr (std::is_same_v<T, char>) {
+        return std::string(1, value);
+    } else if constexpr (std::is_floating_point_v<T>) {
+        return format_float(value);
+    } else if constexpr (std::is_arithmetic_v<T>) {
+        return std::to_string(value);
+    } else {
+        return std::string_view(value);
+    }
+}
+
+// Concatenate pieces of text into a string allocated once, at its full size
+template <typename... Pieces>
+inline std::string join_strings(const Pieces&... pieces) {
+    std::string result;
+    result.reserve((std::string_view(pieces).size() + ... + 0));
+    (result.append(pieces), ...);
+    return result;
+}
+#endif
+"""
+
+RESERVE_MORE = r"""#ifndef PYTHON_TO_CPP_RESERVE_MORE
+#define PYTHON_TO_CPP_RESERVE_MORE
+// Make room for extra more elements, growing geometrically as appending does,
+// so that reserving inside an outer loop doesn't reallocate on every pass
+template <typename Container>
+inline void reserve_more(Container& container, std::size_t extra) {
+    std::size_t needed = container.size() + extra;
+    if (needed > container.capacity()) {
+        container.reserve(std::max(needed, 2 * container.capacity()));
+    }
+}
+#endif
+"""
+
+# Helpers are emitted in this order, after any they use
+SUPPORT = {
+    "format_float": (FORMAT_FLOAT, ("<charconv>", "<cmath>", "<cstdlib>", "<string>")),
+    "join_strings": (
+        JOIN_STRINGS,
+        ("<string>", "<string_view>", "<type_traits>"),
+    ),
+    "reserve_more": (RESERVE_MORE, ("<algorithm>", "<cstddef>")),
+}
+
+# Size of the buffer given to std::cout by fast output mode
+OUTPUT_BUFFER_SIZE = 1 << 16
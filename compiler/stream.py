@@ -0,0 +1,69 @@
+import tokenize
+from tokenize import COMMENT, DEDENT, ENDMARKER, INDENT, NEWLINE, NL
+
+# Keywords that carry a compound statement on past the end of its first block
+CONTINUATIONS = frozenset(("elif", "else", "except", "finally"))
+
+# Tokens that never start a statement
+LAYOUT = frozenset((COMMENT, DEDENT, INDENT, NEWLINE, NL))
+
+
+def top_level_statements(path):
+    """Read the top level statements of a python file one at a time.
+
+    Yields the number of the first line of each statement, its byte offset in
+    the file and its utf-8 source, decorators included. Only the lines of the
+    statement being read are kept in memory, so files far larger than memory
+    can be split up. A statement left unterminated at the end of the file is
+    yielded as is, for the parser to report.
+    """
+
+    with open(path, "rb") as source:
+        lines = []
+        first_row = 1
+        offset = 0
+
+        def readline():
+            line = source.readline()
+            lines.append(line)
+            return line.decode()
+
+        start = None
+        depth = 0
+        ended = False
+        decorated = False
+
+        try:
+            for token in tokenize.generate_tokens(readline):
+                kind = token.type
+                if kind == INDENT:
+                    depth += 1
+                    ended = False
+                elif kind == DEDENT:
+                    depth -= 1
+                    ended = depth == 0
+                elif kind == NEWLINE:
+                    ended = depth == 0
+                elif kind == ENDMARKER:
+                    break
+                elif kind not in LAYOUT and (start is None or ended):
+                    row = token.start[0]
+                    if start is None:
+                        start = row
+                    elif token.string not in CONTINUATIONS and not decorated:
+                        leading = b"".join(lines[: start - first_row])
+                        statement = b"".join(lines[start - first_row : row - first_row])
+                        yield start, offset + len(leading), statement
+
+                        del lines[: row - first_row]
+                        offset += len(leading) + len(statement)
+                        first_row = start = row
+
+                    ended = False
+                    decorated = token.string == "@"
+        except tokenize.TokenError:
+            pass
+
+        if start is not None:
+            leading = b"".join(lines[: start - first_row])
+            yield start, offset + len(leading), b"".join(lines[start - first_row :])
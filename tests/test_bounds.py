@@ -0,0 +1,178 @@
+import ast
+import textwrap
+
+import pytest
+
+from compiler.bounds import SafeSubscripts
+from compiler.parser import translate_file
+
+
+def safe_subscripts(source):
+    """ Get the source of the subscripts of a function proven to be in bounds. """
+
+    function = ast.parse(textwrap.dedent(source)).body[0]
+    return sorted(ast.unparse(node) for node in SafeSubscripts(function).safe)
+
+
+@pytest.mark.parametrize(
+    "source, safe",
+    [
+        (
+            """
+            def f(xs: list[int]) -> int:
+                t = 0
+                for i in range(len(xs)):
+                    t += xs[i]
+                return t
+            """,
+            ["xs[i]"],
+        ),
+        (
+            """
+            def f(xs: list[int]) -> int:
+                t = 0
+                for i in range(1, len(xs)):
+                    t += xs[i] - xs[i - 1]
+                return t
+            """,
+            ["xs[i - 1]", "xs[i]"],
+        ),
+        (
+            """
+            def f(n: int) -> int:
+                xs = [0] * n
+                for i in range(n):
+                    xs[i] = i
+                return 0
+            """,
+            ["xs[i]"],
+        ),
+        (
+            """
+            def f() -> int:
+                xs = [1, 2, 3]
+                return xs[0] + xs[2] + xs[3]
+            """,
+            ["xs[0]", "xs[2]"],
+        ),
+    ],
+)
+def test_proven_subscripts_are_safe(source, safe):
+    assert safe_subscripts(source) == safe
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        # The list is resized inside the loop
+        """
+        def f(xs: list[int]) -> int:
+            for i in range(len(xs)):
+                xs.append(xs[i])
+            return 0
+        """,
+        """
+        def f(xs: list[int]) -> int:
+            for i in range(len(xs)):
+                del xs[0]
+                print(xs[i])
+            return 0
+        """,
+        # The list is rebound
+        """
+        def f(xs: list[int]) -> int:
+            for i in range(len(xs)):
+                xs = [1]
+                print(xs[i])
+            return 0
+        """,
+        # The index is reassigned
+        """
+        def f(xs: list[int]) -> int:
+            for i in range(len(xs)):
+                i = i + 1
+                print(xs[i])
+            return 0
+        """,
+        # The bound isn't the length of the list
+        """
+        def f(xs: list[int], n: int) -> int:
+            for i in range(n):
+                print(xs[i])
+            return 0
+        """,
+        """
+        def f(xs: list[int], ys: list[int]) -> int:
+            for i in range(len(ys)):
+                print(xs[i])
+            return 0
+        """,
+        """
+        def f(xs: list[int]) -> int:
+            for i in range(len(xs) + 1):
+                print(xs[i])
+            return 0
+        """,
+        # The index can be negative, or past the end
+        """
+        def f(xs: list[int]) -> int:
+            return xs[-1]
+        """,
+        """
+        def f(xs: list[int]) -> int:
+            for i in range(len(xs)):
+                print(xs[i - 1])
+            return 0
+        """,
+        """
+        def f(xs: list[int], start: int) -> int:
+            for i in range(start, len(xs)):
+                print(xs[i])
+            return 0
+        """,
+        """
+        def f(xs: list[int]) -> int:
+            for i in range(len(xs)):
+                print(xs[i + 1])
+            return 0
+        """,
+        # The step could be negative
+        """
+        def f(xs: list[int], step: int) -> int:
+            for i in range(0, len(xs), step):
+                print(xs[i])
+            return 0
+        """,
+        # The count of a repeated list changes after it is made
+        """
+        def f(n: int) -> int:
+            xs = [0] * n
+            n += 1
+            for i in range(n):
+                xs[i] = i
+            return 0
+        """,
+    ],
+)
+def test_unproven_subscripts_are_checked(source):
+    assert safe_subscripts(source) == []
+
+
+SOURCE = """
+def total(xs: list[int]) -> int:
+    t = 0
+    for i in range(len(xs)):
+        t += xs[i]
+    return t + xs[len(xs) - 1]
+"""
+
+
+@pytest.mark.parametrize("checked, safe", [(False, 1), (True, 0)])
+def test_translation_only_drops_proven_checks(tmp_path, checked, safe):
+    path = tmp_path / "main.py"
+    path.write_text(SOURCE)
+
+    cpp = translate_file(str(path), checked=checked)
+
+    assert cpp.count("xs[i]") == safe
+    assert cpp.count(".at(") == 2 - safe
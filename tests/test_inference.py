@@ -0,0 +1,41 @@
+import pytest
+
+from tests.translation import requires_gxx, run_cpp, run_python, write_source
+
+PROGRAMS = {
+    "tuple_of_variables": """
+    def main() -> int:
+        a = 1
+        b = 2
+        t = (a, b)
+        print(t[0], t[1])
+        return 0
+    """,
+    "mixed_tuple_of_variables": """
+    def main() -> int:
+        a = 1
+        b = 2.5
+        t = (a, b, "c")
+        print(t[0], t[1], t[2])
+        return 0
+    """,
+    "true_division": """
+    def half(x: int) -> float:
+        return x / 2
+
+
+    def main() -> int:
+        x = 7
+        y = x / 2
+        print(y, x / 2, 7 / 2, half(x), x // 2, x / 2.0)
+        return 0
+    """,
+}
+
+
+@requires_gxx
+@pytest.mark.parametrize("program", PROGRAMS)
+def test_inferred_types_match_python(tmp_path, program):
+    path = write_source(tmp_path, PROGRAMS[program])
+
+    assert run_cpp(path, tmp_path) == run_python(path)
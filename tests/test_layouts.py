@@ -0,0 +1,36 @@
+import pytest
+
+from tests.translation import requires_gxx, run_cpp, run_python, write_source
+
+# Loops over a list[bool] in each layout, binding names to its elements, and
+# formatting of its elements
+LOOPS = """
+from typing import Annotated
+
+
+def main() -> int:
+    flags: Annotated[list[bool], "{layout}"] = [True, False, True]
+    others: Annotated[list[bool], "{layout}"] = [False, False, True]
+    for flag in flags:
+        print(flag)
+    for i, flag in enumerate(flags):
+        print(i, flag)
+    for flag, other in zip(flags, others):
+        print(flag and other)
+    for i in range(len(flags)):
+        print(flags[i])
+    text = f"{flags[0]} {flags[1]}"
+    print(text)
+    for flag in flags:
+        text = f"{flag}!"
+        print(text)
+    return 0
+"""
+
+
+@requires_gxx
+@pytest.mark.parametrize("layout", ["bytes", "packed"])
+def test_loops_over_layouts(tmp_path, layout):
+    path = write_source(tmp_path, LOOPS.replace("{layout}", layout))
+
+    assert run_cpp(path, tmp_path) == run_python(path)
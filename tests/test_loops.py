@@ -0,0 +1,89 @@
+import pytest
+
+from compiler.parser import translate_file
+from tests.translation import requires_gxx, run_cpp, run_python, write_source
+
+PROGRAMS = {
+    "range": """
+    def main() -> int:
+        for i in range(10, 0, -3):
+            print(i)
+        n = 5
+        for i in range(n):
+            n = n - 1
+            print(i, n)
+        s = 2
+        for i in range(0, 10, s):
+            print(i)
+        for i in range(3):
+            i = i * 10
+            print(i)
+        return 0
+    """,
+    "zip_enumerate": """
+    def main() -> int:
+        xs = [1, 2, 3]
+        ys = [4, 5]
+        for a, b in zip(xs, ys):
+            print(a + b)
+        for k, v in enumerate(xs, 1):
+            print(k, v)
+        return 0
+    """,
+    "while": """
+    def main() -> int:
+        t = 0
+        while t < 3:
+            t += 1
+        print(t)
+        return 0
+    """,
+    "appends": """
+    def main() -> int:
+        xs: list[int] = []
+        ys: list[int] = [5, 6]
+        n = 3
+        for k in range(100):
+            for i in range(n):
+                xs.append(i)
+                xs.append(k)
+            for y in ys:
+                xs.append(y)
+            for i in range(2, n + 4):
+                if i > 4:
+                    break
+                xs.append(i)
+        j = 0
+        while j < n:
+            xs.append(j)
+            j += 1
+        print(len(xs), xs[0], xs[len(xs) - 1])
+        return 0
+    """,
+    "print": """
+    def main() -> int:
+        x = 1.5
+        print(x, 2.0, 1e20, 0.1 + 0.2)
+        print(True, 3 > 2)
+        print("a", "b", sep="-", end="!\\n")
+        return 0
+    """,
+}
+
+
+@requires_gxx
+@pytest.mark.parametrize("program", PROGRAMS)
+def test_loops_match_python(tmp_path, program):
+    path = write_source(tmp_path, PROGRAMS[program])
+
+    assert run_cpp(path, tmp_path) == run_python(path)
+
+
+def test_counted_appends_reserve(tmp_path):
+    path = write_source(tmp_path, PROGRAMS["appends"])
+    cpp = translate_file(str(path))
+
+    assert "if (0 < n) reserve_more(xs, 2 * n);" in cpp
+    assert "reserve_more(xs, ys.size());" in cpp
+    assert "if (j < n) reserve_more(xs, (n - j));" in cpp
+    assert cpp.count("reserve_more(xs") == 3
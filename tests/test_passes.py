@@ -0,0 +1,121 @@
+import ast
+import glob
+import textwrap
+
+import pytest
+
+from compiler.passes import (
+    ConstantFolding,
+    DeadCodeElimination,
+    LoopInvariantHoisting,
+)
+from tests.translation import requires_gxx, run_cpp, write_source
+
+
+def run_pass(transform, source):
+    tree = ast.parse(textwrap.dedent(source))
+    return ast.unparse(transform().run(tree))
+
+
+def test_folding_leaves_division_to_cpp():
+    folded = run_pass(ConstantFolding, "x = (1 + 2 * 3, -7 // 2, 7 / 2, -7 % 3)")
+
+    assert folded == "x = (7, -7 // 2, 7 / 2, -7 % 3)"
+
+
+def test_dead_code_is_removed():
+    source = """
+    def f(x: int) -> int:
+        "Docstring"
+        if False:
+            x = 1
+        else:
+            x = 2
+            x += 1
+        return x
+        x = 3
+    """
+
+    assert run_pass(DeadCodeElimination, source) == textwrap.dedent(
+        """\
+        def f(x: int) -> int:
+            x = 2
+            x += 1
+            return x"""
+    )
+
+
+def test_hoisting_moves_only_invariants():
+    source = """
+    for i in range(n):
+        total += i * (n + 1) + n // d
+    """
+
+    assert run_pass(LoopInvariantHoisting, source) == textwrap.dedent(
+        """\
+        _invariant_1 = n + 1
+        for i in range(n):
+            total += i * _invariant_1 + n // d"""
+    )
+
+
+PROGRAMS = {
+    "arithmetic": """
+    def main() -> int:
+        print(-7 // 2, 7 / 2, -7 % 3, 1 + 2 * 3, 1 << 4)
+        n = 7
+        print(-n // 2, n / 2, -n % 3)
+        return 0
+    """,
+    "else_loop": """
+    def main() -> int:
+        n = 3
+        xs: list[int] = [1, 2, 3]
+        if n > 5:
+            print(n)
+        else:
+            for x in xs:
+                print(x * (n + 1))
+        return 0
+    """,
+    "constant_branches": """
+    def main() -> int:
+        n = 3
+        if n > 5:
+            print(n)
+        else:
+            if True:
+                print(n + 1)
+                print(n + 2)
+        while False:
+            print(n)
+        return 0
+        print(n)
+    """,
+    "nested_loops": """
+    def main() -> int:
+        total = 0
+        n = 4
+        for i in range(n):
+            j = 0
+            while j < n * 2:
+                total += i * (n - 1) + j
+                j += 1
+        print(total)
+        return 0
+    """,
+}
+
+EXAMPLES = sorted(glob.glob("py/*/main.py"))
+
+
+@requires_gxx
+@pytest.mark.parametrize("program", [*PROGRAMS, *EXAMPLES])
+def test_passes_keep_output(tmp_path, program):
+    if program in PROGRAMS:
+        path = write_source(tmp_path, PROGRAMS[program])
+    else:
+        path = program
+
+    optimised = run_cpp(path, tmp_path, "passes", passes=("fold", "dce", "hoist"))
+    assert optimised == run_cpp(path, tmp_path, "plain", passes=())
@@ -0,0 +1,64 @@
+import ast
+import io
+
+from compiler.parser import shard_index, translate_to_shards
+from tests.translation import write_source
+
+SHARDS = 4
+
+EDITED = """
+def edited(n: int) -> int:
+    return n
+"""
+
+# Gives the edited function hidden loop counters and hoisted variables
+EDITED_LOOPS = """
+def edited(n: int) -> int:
+    t = 0
+    for i in range(n):
+        t += i * (n + 2)
+    ys = [1, 2]
+    for i, x in enumerate(ys):
+        t += x
+    return t
+"""
+
+OTHER = """
+def {name}(xs: list[int], n: int) -> int:
+    t = 0
+    for i in range(n):
+        for x in xs:
+            t += x * (n + 1)
+    for i, x in enumerate(xs):
+        t += i * x
+    return t
+"""
+
+
+def shard_of(name):
+    return shard_index(ast.parse(f"def {name}(): pass").body[0], SHARDS)
+
+
+def shard_sources(tmp_path, source):
+    path = write_source(tmp_path, source)
+
+    outputs = [io.StringIO() for _ in range(SHARDS)]
+    translate_to_shards(str(path), outputs, io.StringIO(), "main.hpp")
+
+    return [output.getvalue() for output in outputs]
+
+
+def test_editing_a_function_leaves_other_shards_unchanged(tmp_path):
+    edited = shard_of("edited")
+
+    names = [f"other_{index}" for index in range(20)]
+    names = [name for name in names if shard_of(name) != edited][:3]
+    others = "".join(OTHER.replace("{name}", name) for name in names)
+
+    before = shard_sources(tmp_path, EDITED + others)
+    after = shard_sources(tmp_path, EDITED_LOOPS + others)
+
+    assert before[edited] != after[edited]
+    for index in range(SHARDS):
+        if index != edited:
+            assert before[index] == after[index]
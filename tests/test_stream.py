@@ -0,0 +1,60 @@
+import pytest
+
+from compiler import CompileError
+from compiler.parser import translate_file
+from compiler.profile import TranslationProfile
+from tests.translation import write_source
+
+SOURCE = """
+def square(x: int) -> int:
+    return x * x
+
+
+def total(xs: list[int]) -> int:
+    t = 0
+    for x in xs:
+        t += square(x)
+    return t
+
+
+def main() -> int:
+    xs = [1, 2, 3]
+    print(total(xs))
+    return 0
+"""
+
+# An error on the last line, after every other definition has been streamed
+BROKEN = SOURCE.replace("    return 0\n", '    print(xs, file="out")\n')
+
+
+def line_calls(path, stream):
+    profile = TranslationProfile()
+    translate_file(str(path), profile=profile, stream=stream)
+
+    # Passes, recorded against the file, and modules, which have no line, are
+    # run once per streamed part
+    return {
+        location: entry.calls
+        for location, entry in profile.lines.items()
+        if location not in (str(path), f"{path}:0")
+    }
+
+
+def test_stream_profiles_the_same_lines(tmp_path):
+    path = write_source(tmp_path, SOURCE)
+
+    assert line_calls(path, stream=True) == line_calls(path, stream=False)
+
+
+def test_stream_reports_errors_at_the_same_line(tmp_path):
+    path = write_source(tmp_path, BROKEN)
+    last_line = len(BROKEN.splitlines())
+
+    errors = []
+    for stream in (False, True):
+        with pytest.raises(CompileError) as error:
+            translate_file(str(path), stream=stream)
+        errors.append(str(error.value))
+
+    assert f"line {last_line}>" in errors[0]
+    assert errors[1] == errors[0]
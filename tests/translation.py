@@ -0,0 +1,49 @@
+""" Helpers that translate python sources, then build and run the c++. """
+
+import contextlib
+import io
+import shutil
+import subprocess
+import textwrap
+
+import pytest
+
+from compiler.parser import translate_file
+
+requires_gxx = pytest.mark.skipif(
+    shutil.which("g++") is None, reason="g++ is not installed"
+)
+
+
+def write_source(tmp_path, source, name="main"):
+    path = tmp_path / f"{name}.py"
+    path.write_text(textwrap.dedent(source))
+
+    return path
+
+
+def run_cpp(path, tmp_path, name="main", **options):
+    """ Translate the python file at path, then compile and run it for its output. """
+
+    cpp = tmp_path / f"{name}.cpp"
+    cpp.write_text(translate_file(str(path), **options))
+
+    executable = tmp_path / name
+    subprocess.run(["g++", "-O1", "-o", executable, cpp], check=True)
+
+    return subprocess.run(
+        [executable], capture_output=True, text=True, timeout=30, check=True
+    ).stdout
+
+
+def run_python(path):
+    """ Run main() of the python file at path for its output. """
+
+    namespace = {}
+    exec(compile(path.read_text(), str(path), "exec"), namespace)
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        namespace["main"]()
+
+    return output.getvalue()
@@ -1,7 +1,148 @@
+import argparse
+import os
 import sys
-from build import generate_cpp
+import time
 
-src = sys.argv[1]
-dts = sys.argv[2]
+from builder import BuildError
+from builder.daemon import SOCKET_PATH, request, serve, watch
 
-generate_cpp(src, dst)
\ No newline at end of file
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Translate python files to c++",
+        epilog="Files are translated by a running daemon when there is one.",
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        metavar="SRC DST",
+        help="Pairs of python sources and the c++ files to write them to",
+    )
+    parser.add_argument(
+        "--socket",
+        default=SOCKET_PATH,
+        help=f"Unix socket of the translation daemon (default {SOCKET_PATH})",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Always translate in this process",
+    )
+
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run a translation daemon in the foreground",
+    )
+    modes.add_argument(
+        "--stop",
+        action="store_true",
+        help="Stop the running translation daemon",
+    )
+    modes.add_argument(
+        "--watch",
+        metavar="DIR",
+        help="Retranslate python files under DIR into cpp/ whenever they change",
+    )
+
+    args = parser.parse_args()
+
+    if len(args.files) % 2:
+        parser.error("files must be given as SRC DST pairs")
+
+    return args
+
+
+def translate_local(pairs):
+    # Imported here so that clients of a running daemon stay cheap to start
+    from build import generate_cpp
+
+    for source, output in pairs:
+        generate_cpp(source, output)
+
+
+def translate(pairs, socket_path, use_daemon=True):
+    """Translate (source, output) pairs, preferring a running daemon.
+
+    Falls back to translating in this process when no daemon is reachable.
+    """
+
+    if use_daemon:
+        try:
+            response = request(
+                {"command": "translate", "cwd": os.getcwd(), "files": pairs},
+                socket_path,
+            )
+        except OSError:
+            response = None
+
+        if response is not None and "results" in response:
+            failures = [
+                result
+                for result in response["results"]
+                if result["error"] is not None
+            ]
+            for result in failures:
+                print(f"{result['source']}: {result['error']}", file=sys.stderr)
+
+            if failures:
+                raise BuildError(
+                    f"{len(failures)} of {len(pairs)} translations failed"
+                )
+
+            return
+
+    translate_local(pairs)
+
+
+def main():
+    args = parse_args()
+
+    if args.serve:
+        from build import generate_cpp
+
+        serve(generate_cpp, args.socket)
+        return
+
+    if args.stop:
+        try:
+            request({"command": "stop"}, args.socket)
+        except OSError:
+            sys.exit(f"No translation daemon is listening on {args.socket}")
+        return
+
+    use_daemon = not args.no_daemon
+
+    if args.watch:
+        from build import cpp_dir, replace_top_dir
+
+        def on_change(sources):
+            start = time.perf_counter()
+            pairs = [
+                (source, replace_top_dir(source, cpp_dir, ".cpp"))
+                for source in sources
+            ]
+            try:
+                translate(pairs, args.socket, use_daemon)
+            except Exception as error:
+                print(error, file=sys.stderr)
+                return
+
+            elapsed = time.perf_counter() - start
+            print(f"Translated {len(pairs)} files in {elapsed:.3f}s")
+
+        watch(args.watch, on_change)
+        return
+
+    files = args.files
+    pairs = list(zip(files[::2], files[1::2]))
+
+    try:
+        translate(pairs, args.socket, use_daemon)
+    except BuildError as error:
+        sys.exit(str(error))
+
+
+if __name__ == "__main__":
+    main()